@@ -0,0 +1,246 @@
+"""Bulk file translation from the command line.
+
+Streams records from a text, JSONL or CSV file, translates them in batches and
+appends results to the output as it goes, so memory stays flat for any input size:
+
+    python batch_translate.py corpus.txt corpus.en.txt --src Chinese --tgt English
+    python batch_translate.py data.jsonl out.jsonl --src zh --tgt en --field text
+
+A checkpoint (`<output>.ckpt`) records how many records are done and how long the
+output was at that point. Re-running the same command after a crash or kill resumes
+from there instead of starting over; a checkpoint left by a different input, field or
+language pair is refused rather than mixed into the output.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from cache import TranslationCache
+from engine import CPU_PROFILES, LANGUAGES, TranslationEngine, resolve_language
+from metrics import configure_json_log
+from segmentation import segment_document
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    return "txt"
+
+
+def read_records(f, fmt, field):
+    """Yield (record, text) pairs one at a time"""
+    if fmt == "jsonl":
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record, record.get(field, "")
+    elif fmt == "csv":
+        for record in csv.DictReader(f):
+            yield record, record.get(field, "")
+    else:
+        for line in f:
+            text = line.rstrip("\r\n")
+            yield text, text
+
+
+class RecordWriter:
+    """Appends translated records in the input's format"""
+
+    def __init__(self, f, fmt, field, output_field):
+        self.f = f
+        self.fmt = fmt
+        self.field = field
+        self.output_field = output_field
+        self._csv = None
+
+    def write(self, record, translation):
+        if self.fmt == "jsonl":
+            record = dict(record)
+            record[self.output_field] = translation
+            self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        elif self.fmt == "csv":
+            if self._csv is None:
+                fieldnames = list(record.keys()) + [self.output_field]
+                self._csv = csv.DictWriter(self.f, fieldnames=fieldnames)
+                if self.f.tell() == 0:
+                    self._csv.writeheader()
+            row = dict(record)
+            row[self.output_field] = translation
+            self._csv.writerow(row)
+        else:
+            # One line per input line; embedded newlines would break the alignment
+            self.f.write(translation.replace("\r", " ").replace("\n", " ") + "\n")
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {"records": 0, "output_bytes": 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def checkpoint_job(input_path, source_lang, target_lang, field):
+    """What a checkpoint was written for; resuming is only safe for the same job"""
+    return {
+        "input": os.path.abspath(input_path),
+        "source": resolve_language(source_lang)["code"],
+        "target": resolve_language(target_lang)["code"],
+        "field": field,
+    }
+
+
+def checkpoint_mismatch(checkpoint, job):
+    """Describe how `checkpoint` differs from `job`, or return None when it can be resumed"""
+    if not checkpoint["records"]:
+        return None
+    differences = [f"{key} {checkpoint.get(key)!r} != {value!r}" for key, value in job.items() if checkpoint.get(key) != value]
+    if differences:
+        return "Checkpoint belongs to a different job (" + ", ".join(differences) + "); remove it or pick another output"
+    return None
+
+
+def save_checkpoint(path, records, output_bytes, job):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(job, records=records, output_bytes=output_bytes), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def translate_file(engine, input_path, output_path, source_lang, target_lang,
+                   fmt=None, field="text", output_field="translation", batch_size=16,
+                   report_every=30.0, log=print):
+    """Translate `input_path` into `output_path`, resuming from its checkpoint"""
+    fmt = fmt or detect_format(input_path)
+    source_lang = resolve_language(source_lang)
+    target_lang = resolve_language(target_lang)
+    checkpoint_path = output_path + ".ckpt"
+    checkpoint = load_checkpoint(checkpoint_path)
+    job = checkpoint_job(input_path, source_lang, target_lang, field)
+    mismatch = checkpoint_mismatch(checkpoint, job)
+    if mismatch:
+        raise ValueError(mismatch)
+    done = checkpoint["records"]
+
+    # Drop anything written after the last checkpoint, it will be redone
+    mode = "r+" if os.path.exists(output_path) and done else "w"
+    with open(input_path, encoding="utf-8", newline="") as fin, \
+            open(output_path, mode, encoding="utf-8", newline="") as fout:
+        if mode == "r+":
+            fout.seek(checkpoint["output_bytes"])
+            fout.truncate()
+            log(f"Resuming after {done} records")
+
+        writer = RecordWriter(fout, fmt, field, output_field)
+        records = itertools.islice(read_records(fin, fmt, field), done, None)
+
+        started = time.perf_counter()
+        last_report = started
+        segments = 0
+        # Counted by the engine as it decodes; cache hits generate nothing
+        tokens_before = engine.decoding_totals["generated_tokens"]
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+
+            # Blank records are passed through without touching the model. Records
+            # longer than one segment would be truncated by a single generate call,
+            # so they go through translate_document; the rest share one batch.
+            translations = {}
+            short = []
+            for i, (_, text) in enumerate(batch):
+                if not text.strip():
+                    translations[i] = ""
+                    continue
+                count = len(segment_document(text, source_lang["code"])[0])
+                if count > 1:
+                    translations[i] = engine.translate_document(
+                        text, source_lang, target_lang, batch_size=batch_size
+                    )
+                    segments += count
+                else:
+                    short.append(i)
+            results = engine.translate_batch([(batch[i][1], source_lang, target_lang) for i in short])
+            translations.update(zip(short, results))
+            segments += len(short)
+            for i, (record, _) in enumerate(batch):
+                writer.write(record, translations[i])
+            done += len(batch)
+
+            fout.flush()
+            os.fsync(fout.fileno())
+            save_checkpoint(checkpoint_path, done, fout.tell(), job)
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                elapsed = now - started
+                tokens = engine.decoding_totals["generated_tokens"] - tokens_before
+                log(f"{done} records | {segments / elapsed:.2f} segments/sec | {tokens / elapsed:.1f} tokens/sec")
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    tokens = engine.decoding_totals["generated_tokens"] - tokens_before
+    log(f"Done: {done} records, {segments} segments in {elapsed:.1f}s "
+        f"({segments / elapsed if elapsed else 0:.2f} segments/sec, {tokens / elapsed if elapsed else 0:.1f} tokens/sec)")
+    # Nothing was checkpointed when there was nothing left to translate
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return done
+
+
+def main(argv=None):
+    language_choices = list(LANGUAGES) + [entry["code"] for entry in LANGUAGES.values()]
+    parser = argparse.ArgumentParser(description="Translate text/JSONL/CSV files with Offline-Translator")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--src", required=True, choices=language_choices)
+    parser.add_argument("--tgt", required=True, choices=language_choices)
+    parser.add_argument("--format", choices=["txt", "jsonl", "csv"], help="Defaults to the input file extension")
+    parser.add_argument("--field", default="text", help="JSONL key / CSV column holding the source text")
+    parser.add_argument("--output-field", default="translation")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--report-every", type=float, default=30.0, help="Seconds between throughput reports")
+    parser.add_argument("--device", default="cpu", help="cpu or cuda:N")
+    parser.add_argument("--cpu-profile", default="bf16", choices=list(CPU_PROFILES))
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--deterministic", action="store_true", help="Greedy decoding with translation memory")
+    parser.add_argument("--cleanup-rules", default=None, help="JSON file of per-pair output cleanup rules")
+    parser.add_argument("--metrics-log", default=None, help="Append per-batch traces to this JSONL file")
+    args = parser.parse_args(argv)
+
+    if args.metrics_log:
+        configure_json_log(args.metrics_log)
+
+    if resolve_language(args.src) == resolve_language(args.tgt):
+        parser.error("Source and target languages cannot be the same.")
+    # Checked before the model is loaded; translate_file checks again
+    mismatch = checkpoint_mismatch(
+        load_checkpoint(args.output + ".ckpt"), checkpoint_job(args.input, args.src, args.tgt, args.field)
+    )
+    if mismatch:
+        parser.error(mismatch)
+
+    engine = TranslationEngine(
+        args.model_dir, cache=TranslationCache(), deterministic=args.deterministic, cleanup_rules=args.cleanup_rules
+    )
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+    engine.load(args.device, progress=log, cpu_profile=args.cpu_profile)
+    translate_file(
+        engine, args.input, args.output, args.src, args.tgt,
+        fmt=args.format, field=args.field, output_field=args.output_field,
+        batch_size=args.batch_size, report_every=args.report_every, log=log
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Reproducible latency/throughput/memory benchmark for the translation engine.
+
+    python benchmark.py --tiny --output bench.json            # CPU-only, no 14 GB weights
+    python benchmark.py --devices cuda:0 cpu --decoding standard prompt-lookup
+    python benchmark.py --tiny --output new.json --compare bench.json
+
+`--tiny` builds a randomly initialized two-layer Mistral with the repository's
+tokenizer, so the whole load/generate path runs in CI on a CPU-only machine. The
+outputs are gibberish; only the timings matter. Results are written as JSON and
+`--compare` reports relative changes against a previous run, exiting non-zero when
+latency or throughput regress beyond `--threshold`.
+
+Each device/decoding setting runs in its own spawned process, so its peak RSS is
+its own and not the maximum of every setting before it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import CPU_PROFILES, DECODING_MODES, DEFAULT_MODEL_DIR, LANGUAGES, TranslationEngine, resolve_language
+from lifecycle import peak_rss_bytes
+
+# Seed sentences per language; corpora are built by cycling through them
+SEED_SENTENCES = {
+    "en": ["The new model supports offline translation.", "Please restart the application after the update.",
+           "Our team shipped version 2.1 on March 3rd.", "Battery life is about twelve hours."],
+    "zh": ["新模型支持离线翻译。", "更新后请重新启动应用程序。", "我们的团队在3月3日发布了2.1版本。", "电池续航大约十二个小时。"],
+    "es": ["El nuevo modelo admite traducción sin conexión.", "Reinicie la aplicación después de la actualización.",
+           "Nuestro equipo publicó la versión 2.1 el 3 de marzo.", "La batería dura unas doce horas."],
+    "fr": ["Le nouveau modèle prend en charge la traduction hors ligne.", "Veuillez redémarrer l'application après la mise à jour.",
+           "Notre équipe a publié la version 2.1 le 3 mars.", "L'autonomie de la batterie est d'environ douze heures."],
+    "de": ["Das neue Modell unterstützt Offline-Übersetzung.", "Bitte starten Sie die Anwendung nach dem Update neu.",
+           "Unser Team hat Version 2.1 am 3. März veröffentlicht.", "Die Akkulaufzeit beträgt etwa zwölf Stunden."],
+    "ja": ["新しいモデルはオフライン翻訳に対応しています。", "更新後にアプリケーションを再起動してください。",
+           "私たちのチームは3月3日にバージョン2.1をリリースしました。", "バッテリーは約12時間持ちます。"],
+    "ko": ["새 모델은 오프라인 번역을 지원합니다.", "업데이트 후 애플리케이션을 다시 시작하십시오.",
+           "우리 팀은 3월 3일에 버전 2.1을 출시했습니다.", "배터리 수명은 약 12시간입니다."],
+    "ru": ["Новая модель поддерживает офлайн-перевод.", "Перезапустите приложение после обновления.",
+           "Наша команда выпустила версию 2.1 3 марта.", "Батарея работает около двенадцати часов."],
+}
+
+# Target character counts; "long" sits just under the GUI's former 5000-character limit
+SIZES = {"short": 80, "medium": 800, "long": 4800}
+
+DEFAULT_PAIRS = ["zh-en", "en-zh", "ja-en", "en-de", "fr-en", "ru-en", "ko-en", "es-en"]
+
+
+def build_corpus(code, size):
+    """Deterministic text of roughly `SIZES[size]` characters in language `code`"""
+    sentences = SEED_SENTENCES[code]
+    joiner = "" if code in ("zh", "ja") else " "
+    target = SIZES[size]
+    paragraphs = []
+    current = []
+    length = 0
+    i = 0
+    while True:
+        sentence = sentences[i % len(sentences)]
+        if (current or paragraphs) and length + len(joiner) + len(sentence) > target:
+            break
+        current.append(sentence)
+        length += len(sentence) + len(joiner)
+        i += 1
+        # Start a new paragraph every eight sentences, like a real document
+        if len(current) == 8:
+            paragraphs.append(joiner.join(current))
+            current = []
+            length += 2
+    if current:
+        paragraphs.append(joiner.join(current))
+    return "\n\n".join(paragraphs)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_tiny_model(directory, seed=0):
+    """Save a randomly initialized tiny Mistral next to a copy of the real tokenizer"""
+    import torch
+    from transformers import AutoTokenizer, MistralConfig, MistralForCausalLM
+
+    tokenizer = AutoTokenizer.from_pretrained(DEFAULT_MODEL_DIR, legacy=False)
+    config = MistralConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=8192,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        tie_word_embeddings=False,
+    )
+    torch.manual_seed(seed)
+    model = MistralForCausalLM(config).to(torch.bfloat16)
+    model.save_pretrained(directory, safe_serialization=True)
+    tokenizer.save_pretrained(directory)
+    return directory
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def run_setting(model_dir, device, decoding, cpu_profile, pairs, sizes, repeats, seed):
+    import torch
+
+    engine = TranslationEngine(model_dir, deterministic=True, decoding_mode=decoding)
+    if torch.cuda.is_available() and device.startswith("cuda"):
+        torch.cuda.reset_peak_memory_stats(device)
+
+    start = time.perf_counter()
+    engine.load(device, cpu_profile=cpu_profile)
+    load_seconds = time.perf_counter() - start
+    log(f"[{device} {decoding} {cpu_profile}] loaded in {load_seconds:.2f}s")
+
+    cases = []
+    for pair in pairs:
+        source_code, target_code = pair.split("-")
+        source, target = resolve_language(source_code), resolve_language(target_code)
+        for size in sizes:
+            text = build_corpus(source_code, size)
+            latencies, ttfts, rates, tokens = [], [], [], []
+            for _ in range(repeats):
+                torch.manual_seed(seed)
+                begin = time.perf_counter()
+                stream = engine.translate_stream(text, source, target)
+                stream.result()
+                latencies.append(time.perf_counter() - begin)
+                if stream.time_to_first_token is not None:
+                    ttfts.append(stream.time_to_first_token)
+                if stream.tokens_per_second is not None:
+                    rates.append(stream.tokens_per_second)
+                tokens.append(stream.generated_tokens)
+            case = {
+                "pair": pair,
+                "size": size,
+                "chars": len(text),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p90": percentile(latencies, 90),
+                "latency_p99": percentile(latencies, 99),
+                "ttft_p50": percentile(ttfts, 50),
+                "tokens_per_sec_mean": sum(rates) / len(rates) if rates else None,
+                "generated_tokens_mean": sum(tokens) / len(tokens),
+                "tokens_per_forward": (engine.last_decoding_stats or {}).get("tokens_per_forward"),
+            }
+            cases.append(case)
+            log(f"  {pair} {size:6s} p50 {case['latency_p50']:.3f}s"
+                + (f" ttft {case['ttft_p50']:.3f}s" if case["ttft_p50"] is not None else ""))
+
+    gpu_peak = None
+    if torch.cuda.is_available() and device.startswith("cuda"):
+        gpu_peak = torch.cuda.max_memory_allocated(device)
+    result = {
+        "device": device,
+        "decoding": decoding,
+        "cpu_profile": engine.cpu_profile,
+        "load_seconds": load_seconds,
+        "load_timings": engine.load_timings,
+        "weights_bytes": engine.memory_footprint,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "gpu_peak_bytes": gpu_peak,
+        "cases": cases,
+    }
+    engine.unload()
+    return result
+
+
+def compare(current, baseline, threshold):
+    """Return (report lines, regressions) comparing matching cases of two runs"""
+    def index(run):
+        return {
+            (setting["device"], setting["decoding"], setting["cpu_profile"], case["pair"], case["size"]): case
+            for setting in run["results"] for case in setting["cases"]
+        }
+
+    lines = []
+    regressions = 0
+    old_cases = index(baseline)
+    for key, case in sorted(index(current).items()):
+        old = old_cases.get(key)
+        if old is None:
+            continue
+        label = " ".join(key)
+        for metric, higher_is_better in (("latency_p50", False), ("tokens_per_sec_mean", True)):
+            new_value, old_value = case.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > threshold else ""
+            regressions += bool(flag)
+            lines.append(f"{label:40s} {metric:20s} {old_value:10.4f} -> {new_value:10.4f} ({change:+.1%}) {flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Offline-Translator")
+    parser.add_argument("--tiny", action="store_true", help="Use a tiny random Mistral instead of models/")
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--devices", nargs="+", default=["cpu"])
+    parser.add_argument("--decoding", nargs="+", default=["standard"], choices=list(DECODING_MODES))
+    parser.add_argument("--cpu-profile", default="bf16", choices=list(CPU_PROFILES))
+    parser.add_argument("--pairs", nargs="+", default=DEFAULT_PAIRS, help="source-target codes, e.g. zh-en")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    codes = {entry["code"] for entry in LANGUAGES.values()}
+    for pair in args.pairs:
+        source_code, _, target_code = pair.partition("-")
+        if source_code not in codes or target_code not in codes or source_code == target_code:
+            parser.error(f"Invalid language pair: {pair}")
+
+    tiny_dir = None
+    model_dir = args.model_dir
+    if args.tiny:
+        tiny_dir = tempfile.mkdtemp(prefix="translator-bench-")
+        model_dir = build_tiny_model(tiny_dir, seed=args.seed)
+
+    try:
+        import torch
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for device in args.devices:
+            for decoding in args.decoding:
+                # A fresh process per setting: ru_maxrss only ever grows within one
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    results.append(executor.submit(
+                        run_setting, model_dir, device, decoding, args.cpu_profile,
+                        args.pairs, args.sizes, args.repeats, args.seed
+                    ).result())
+    finally:
+        if tiny_dir:
+            shutil.rmtree(tiny_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "model": "tiny-random-mistral" if args.tiny else os.path.abspath(model_dir or DEFAULT_MODEL_DIR),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeats": args.repeats,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        for line in lines:
+            log(line)
+        if regressions:
+            log(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
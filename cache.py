@@ -0,0 +1,127 @@
+"""Two-tier translation memory: an in-memory LRU in front of an optional SQLite file."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translation_memory.db")
+
+# Default in-memory budget (UTF-8 bytes of source + translation)
+DEFAULT_MAX_MEMORY_BYTES = 32 * 1024 * 1024
+
+
+def normalize_segment(text):
+    """Normalize text for cache lookup: NFC, trimmed, runs of spaces collapsed per line"""
+    text = unicodedata.normalize("NFC", text)
+    lines = [" ".join(line.split()) for line in text.strip().splitlines()]
+    return "\n".join(lines)
+
+
+def is_deterministic(generation_params):
+    """Only greedy/beam decoding gives a reproducible result worth caching"""
+    return not generation_params.get("do_sample", False)
+
+
+def make_key(text, source_code, target_code, generation_params, model_name=""):
+    payload = json.dumps(
+        [normalize_segment(text), source_code, target_code, generation_params, model_name],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """LRU memory tier with byte-size eviction plus a persistent SQLite tier"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, translation TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """Return the cached translation for `key` or None"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, translation):
+        with self._lock:
+            self._remember(key, translation)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO translations (key, translation, created) VALUES (?, ?, ?)",
+                    (key, translation, time.time())
+                )
+                self._db.commit()
+
+    def _remember(self, key, translation):
+        size = len(key) + len(translation.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(key) + len(old.encode("utf-8"))
+        self._memory[key] = translation
+        self._memory_bytes += size
+        # Evict least recently used entries until we are back under budget
+        while self._memory_bytes > self.max_memory_bytes:
+            old_key, old_value = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_key) + len(old_value.encode("utf-8"))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
@@ -0,0 +1,102 @@
+"""CPU inference profiles: thread tuning and int8 dynamic quantization of linear layers.
+
+Imported lazily by the engine at load time, so torch is already required here.
+"""
+import os
+
+import torch
+
+QUANTIZED_ARTIFACT = "model.int8.pt"
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity where available)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_threads(num_threads=None, interop_threads=None):
+    """Pin intra-op threads to the host core count; returns the (intra, interop) in effect"""
+    num_threads = num_threads or available_cores()
+    torch.set_num_threads(num_threads)
+    if interop_threads is None:
+        # Generation is one op stream; a couple of inter-op threads are plenty
+        interop_threads = min(2, num_threads)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # Can only be set once, before any inter-op parallel work has started
+        pass
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def quantize_int8(model, progress=None):
+    """Dynamically quantize every nn.Linear to int8, one decoder layer at a time.
+
+    Dynamic quantization needs float32 weights. Converting the whole bf16 model up
+    front would double its size, so each layer is upcast and quantized in turn.
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    report = progress or (lambda message: None)
+    layers = getattr(getattr(model, "model", None), "layers", None) or []
+    for i, layer in enumerate(layers):
+        report(f"Quantizing layer {i + 1}/{len(layers)} to int8...")
+        layer.float()
+        quantize_dynamic(layer, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    # Embeddings, norms and lm_head: the remaining float modules feed fp32 activations
+    model.float()
+    quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    model.eval()
+    return model
+
+
+def _fingerprint(model_dir):
+    weights = os.path.join(model_dir, "model.safetensors")
+    stat = os.stat(weights)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def load_quantized_artifact(model_dir):
+    """Return the cached quantized model if it matches the current weights, else None"""
+    path = os.path.join(model_dir, QUANTIZED_ARTIFACT)
+    if not os.path.exists(path):
+        return None
+    # The artifact is a pickled module written by save_quantized_artifact on this machine
+    artifact = torch.load(path, map_location="cpu", weights_only=False)
+    if artifact.get("fingerprint") != _fingerprint(model_dir):
+        return None
+    return artifact["model"]
+
+
+def save_quantized_artifact(model, model_dir):
+    path = os.path.join(model_dir, QUANTIZED_ARTIFACT)
+    tmp_path = path + ".tmp"
+    torch.save({"fingerprint": _fingerprint(model_dir), "model": model}, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def model_memory_bytes(model):
+    """Bytes held by parameters, buffers and packed int8 weights"""
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    total += sum(b.numel() * b.element_size() for b in model.buffers())
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            weight, bias = module._weight_bias()
+            total += weight.numel() * weight.element_size()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+    return total
+
+
+def model_memory_by_device(model):
+    """Bytes of parameters and buffers on each device, e.g. {"cuda:0": ..., "cuda:1": ...}"""
+    totals = {}
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        device = str(tensor.device)
+        totals[device] = totals.get(device, 0) + tensor.numel() * tensor.element_size()
+    return totals
@@ -0,0 +1,974 @@
+import os
+import sys
+import threading
+import time
+
+from postprocess import Postprocessor
+
+# Heavy dependencies (torch, transformers, accelerate) are imported lazily inside
+# the methods that need them so that importing this module stays cheap.
+
+# Language mappings with better structure for bidirectional translation
+LANGUAGES = {
+    "English": {"name": "English", "code": "en"},
+    "Chinese": {"name": "中文", "code": "zh"},
+    "Spanish": {"name": "Español", "code": "es"},
+    "French": {"name": "Français", "code": "fr"},
+    "German": {"name": "Deutsch", "code": "de"},
+    "Japanese": {"name": "日本語", "code": "ja"},
+    "Korean": {"name": "한국어", "code": "ko"},
+    "Russian": {"name": "Русский", "code": "ru"},
+}
+
+# Decoding settings; only the greedy ones are deterministic and therefore cacheable
+SAMPLING_PARAMS = {
+    "do_sample": True,  # Enable sampling for better quality
+    "temperature": 0.2,  # Slightly higher temperature for better flow
+    "top_p": 0.9,
+    "repetition_penalty": 1.02,  # Reduced to avoid cutting off valid repetitions
+}
+GREEDY_PARAMS = {
+    "do_sample": False,
+    "repetition_penalty": 1.02,
+}
+
+# CPU inference profiles shown next to the device menu (implemented in cpu_profile.py)
+CPU_PROFILES = {
+    "bf16": "bf16 (default)",
+    "int8": "int8 dynamic quantization",
+    "int8-cached": "int8 + cached artifact",
+}
+
+# Decoding modes: plain one-token-per-forward decoding, n-gram drafting from the
+# prompt, or drafting with a small model from DEFAULT_DRAFT_DIR. Both accelerated
+# modes verify drafted tokens in a single forward pass of the main model.
+DECODING_MODES = {
+    "standard": "Standard",
+    "prompt-lookup": "Prompt lookup",
+    "assisted": "Draft model",
+}
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+DEFAULT_DRAFT_DIR = os.path.join(DEFAULT_MODEL_DIR, "draft")
+# Per-pair cleanup rules picked up from the model directory (see postprocess.py)
+CLEANUP_RULES_FILE = "cleanup_rules.json"
+
+
+def list_devices():
+    """Return available devices, CUDA GPUs first and CPU last"""
+    import torch
+
+    devices = []
+
+    # Check for CUDA GPUs first and add them to the front of the list
+    if torch.cuda.is_available():
+        gpu_count = torch.cuda.device_count()
+        for i in range(gpu_count):
+            gpu_name = torch.cuda.get_device_name(i)
+            devices.append(f"cuda:{i} ({gpu_name})")
+
+    # Add CPU as the last option
+    devices.append("cpu")
+    return devices
+
+
+def format_bytes(num_bytes):
+    """Human readable byte count"""
+    if num_bytes is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
+
+
+def parse_device(device_selection):
+    """Extract the torch device string from a device menu entry"""
+    # Parse device from selection (extract cuda:X from "cuda:X (GPU Name)" format)
+    if device_selection.startswith("cuda:"):
+        return device_selection.split(" ")[0]  # Extract "cuda:X" part
+    return "cpu"
+
+
+def resolve_language(lang):
+    """Accept a LANGUAGES key, a language code or a language entry dict"""
+    if isinstance(lang, dict):
+        return lang
+    if lang in LANGUAGES:
+        return LANGUAGES[lang]
+    for entry in LANGUAGES.values():
+        if entry["code"] == lang:
+            return entry
+    raise ValueError(f"Unsupported language: {lang}")
+
+
+def prompt_parts(input_content, source_lang, target_lang, preamble=""):
+    """Split the prompt into the prefix shared by the language pair and the per-request body"""
+    source_name = source_lang["name"]
+    target_name = target_lang["name"]
+
+    # Use extremely simple prompts to get only translation without explanations
+    if source_name == "中文" and target_name == "English":
+        return f"{preamble}中文：", f"{input_content}\n英文："
+    elif source_name == "English" and target_name == "中文":
+        return f"{preamble}English: ", f"{input_content}\n中文："
+    elif source_name == "中文":
+        return f"{preamble}中文：", f"{input_content}\n{target_name}："
+    elif target_name == "English":
+        return f"{preamble}{source_name}: ", f"{input_content}\nEnglish:"
+    else:
+        return f"{preamble}{source_name}: ", f"{input_content}\n{target_name}:"
+
+
+def build_prompt(input_content, source_lang, target_lang, preamble=""):
+    """Build the translation prompt for a language pair"""
+    return "".join(prompt_parts(input_content, source_lang, target_lang, preamble))
+
+
+class TranslationCancelled(Exception):
+    """Raised for a translation whose CancelToken was set before it finished"""
+
+
+class CancelToken:
+    """Cancellation flag shared between a caller and the generation it started.
+
+    Generation checks the flag before every decoding step, so a cancelled request
+    stops within one token and its KV cache is released when generate returns.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class TranslationEngine:
+    """Headless translation engine: load, translate and unload the model without a GUI"""
+
+    def __init__(self, model_dir=None, cache=None, deterministic=False, preamble="", use_prefix_cache=False,
+                 decoding_mode="standard", draft_model_dir=None, prompt_lookup_num_tokens=10, metrics=None,
+                 cleanup_rules=None):
+        self.model_name = model_dir or DEFAULT_MODEL_DIR
+        self.model = None
+        self.tokenizer = None
+        self.device = None
+        # Optional TranslationCache; consulted only when decoding is deterministic
+        self.cache = cache
+        self.deterministic = deterministic
+        # Optional instruction/few-shot text placed before every prompt
+        self.preamble = preamble
+        # KV cache of the per-pair prompt prefix; created on load when enabled
+        self.use_prefix_cache = use_prefix_cache
+        self.prefix_cache = None
+        self.decoding_mode = decoding_mode
+        self.draft_model_dir = draft_model_dir or DEFAULT_DRAFT_DIR
+        self.draft_model = None
+        self.prompt_lookup_num_tokens = prompt_lookup_num_tokens
+        # Output cleanup rules: an explicit JSON file, else the model's own, else the defaults
+        model_rules = os.path.join(self.model_name, CLEANUP_RULES_FILE)
+        if cleanup_rules is None and os.path.exists(model_rules):
+            cleanup_rules = model_rules
+        self.postprocessor = Postprocessor.from_file(cleanup_rules) if cleanup_rules else Postprocessor()
+        # Forward passes vs generated tokens of the last generate call and of the session
+        self.last_decoding_stats = None
+        self.decoding_totals = {"generated_tokens": 0, "forward_passes": 0}
+        self.cpu_profile = "bf16"
+        # Module -> device placement and weight bytes per device of the loaded model
+        self.device_map = None
+        self.memory_by_device = {}
+        self.memory_footprint = None
+        self.process_rss = None
+        self.load_timings = {}
+        # "unloaded", "resident", "offloaded" (weights parked in CPU RAM) or "released"
+        # (freed while idle); the last two come back on the next request
+        self.residency = "unloaded"
+        self.last_used = None
+        self._load_args = None
+        self._lifecycle_lock = threading.RLock()
+        # Counters, histograms and per-request traces (metrics.REGISTRY unless given)
+        if metrics is None:
+            from metrics import REGISTRY as metrics
+        self.metrics = metrics
+        # Serializes generate calls; the model is not safe to drive from several threads
+        self._generate_lock = threading.Lock()
+        # Tokens of generations queued or running, so cancel() can stop all of them
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self.model is not None and self.tokenizer is not None
+
+    @property
+    def generation_params(self):
+        return dict(GREEDY_PARAMS if self.deterministic else SAMPLING_PARAMS)
+
+    def _cache_key(self, input_content, source_lang, target_lang):
+        """Cache key for a job, or None when the current settings must not be cached"""
+        from cache import is_deterministic, make_key
+
+        params = self.generation_params
+        if self.cache is None or not is_deterministic(params):
+            return None
+        # Anything else that changes the output for the same input: the prompt preamble,
+        # the cleanup rules and int8 weights, whose greedy output differs from bf16
+        weights = "bf16" if self.cpu_profile == "bf16" else "int8"
+        params = dict(params, cleanup=self.postprocessor.fingerprint, preamble=self.preamble, weights=weights)
+        return make_key(input_content, source_lang["code"], target_lang["code"], params, self.model_name)
+
+    def cached_translation(self, input_content, source_lang, target_lang):
+        """Return a cached translation without touching the model, or None"""
+        key = self._cache_key(input_content, resolve_language(source_lang), resolve_language(target_lang))
+        return self.cache.get(key) if key else None
+
+    def load(self, device="cpu", progress=None, cpu_profile="bf16", num_threads=None, fast=True, warmup=True,
+             shard_devices=None, max_memory=None):
+        """Load tokenizer and weights onto `device`; `progress` receives status strings.
+
+        `cpu_profile` selects bf16, int8 dynamic quantization, or int8 reusing a
+        quantized artifact cached next to the weights (see CPU_PROFILES). `fast`
+        memory-maps the safetensors file instead of dispatching through accelerate,
+        and `warmup` runs a tiny generation so the first translation isn't penalized.
+        Per-phase seconds are left in `load_timings`.
+
+        `shard_devices` (e.g. ["cuda:0", "cuda:1", "cpu"]) splits the decoder layers
+        across several devices for models that don't fit on one; `max_memory`
+        optionally caps the bytes used per device.
+        """
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM, AutoConfig
+        from accelerate import init_empty_weights, load_checkpoint_and_dispatch
+        import cpu_profile as profiles
+        import fast_load
+        from lifecycle import process_rss_bytes
+
+        device = parse_device(shard_devices[0] if shard_devices else device)
+        report = progress or (lambda message: None)
+        quantize = device == "cpu" and not shard_devices and cpu_profile in ("int8", "int8-cached")
+        timings = {}
+
+        status_prefix = ""
+        if device == "cpu":
+            status_prefix = "(CPU loading can be slow, please be patient) "
+            intra, interop = profiles.configure_threads(num_threads)
+            report(f"{status_prefix}Using {intra} compute threads, {interop} inter-op threads")
+
+        def phase(name, message):
+            done = ", ".join(f"{key} {seconds:.1f}s" for key, seconds in timings.items())
+            report(f"{status_prefix}{message}" + (f" [{done}]" if done else ""))
+            return _Timed(timings, name)
+
+        with phase("tokenizer", "Loading tokenizer..."):
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, legacy=False)
+            # Decoder-only models must be left-padded so every row ends at the generation position
+            self.tokenizer.padding_side = "left"
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        model = None
+        if quantize and cpu_profile == "int8-cached":
+            with phase("weights", "Loading cached int8 model..."):
+                model = profiles.load_quantized_artifact(self.model_name)
+            if model is None:
+                del timings["weights"]
+
+        if model is None:
+            with phase("config", "Loading model configuration..."):
+                config = AutoConfig.from_pretrained(self.model_name)
+
+            with phase("empty init", "Initializing empty model..."):
+                with init_empty_weights():
+                    model_empty = AutoModelForCausalLM.from_config(config, torch_dtype=torch.bfloat16)
+
+            target = ", ".join(shard_devices).upper() if shard_devices else device.upper()
+            with phase("weights", f"Loading model weights to {target}..."):
+                if shard_devices:
+                    # Layers are placed device by device until each one's budget is spent
+                    model_empty.tie_weights()
+                    device_map = fast_load.shard_device_map(model_empty, shard_devices, max_memory, dtype=torch.bfloat16)
+                    model = load_checkpoint_and_dispatch(
+                        model_empty, self.model_name, device_map=device_map,
+                        no_split_module_classes=model_empty._no_split_modules, dtype=torch.bfloat16
+                    )
+                elif fast:
+                    # Zero-copy on CPU: parameters are views of the mapped checkpoint
+                    state_dict = fast_load.load_state_dict(self.model_name, dtype=torch.bfloat16)
+                    fast_load.assign_weights(model_empty, state_dict)
+                    del state_dict
+                    model = model_empty.to(device)
+                else:
+                    model_empty.tie_weights()
+                    model = load_checkpoint_and_dispatch(
+                        model_empty, self.model_name, device_map={"": device},
+                        # Let the architecture name its own decoder layer (MistralDecoderLayer here)
+                        no_split_module_classes=model_empty._no_split_modules, dtype=torch.bfloat16
+                    )
+                model.eval()
+
+            if quantize:
+                with phase("quantize", "Quantizing to int8..."):
+                    model = profiles.quantize_int8(model, progress=lambda message: report(status_prefix + message))
+                if cpu_profile == "int8-cached":
+                    with phase("save int8", "Saving int8 model for faster loading next time..."):
+                        profiles.save_quantized_artifact(model, self.model_name)
+
+        if warmup:
+            with phase("warm-up", "Warming up..."):
+                fast_load.warm_up(model, self.tokenizer)
+
+        if self.use_prefix_cache:
+            from prefix_cache import PrefixCache
+            self.prefix_cache = PrefixCache()
+
+        self.model = model
+        # Inputs go where the embeddings live, which is the first device of a sharded map
+        self.device = str(model.device) if shard_devices else device
+        self.device_map = dict(getattr(model, "hf_device_map", None) or {"": device})
+        self.cpu_profile = cpu_profile if quantize else "bf16"
+        self.load_timings = timings
+        self.memory_footprint = profiles.model_memory_bytes(model)
+        self.memory_by_device = profiles.model_memory_by_device(model)
+        self.process_rss = process_rss_bytes()
+        self.residency = "resident"
+        self.last_used = time.monotonic()
+        self._load_args = dict(
+            device=device, cpu_profile=cpu_profile, num_threads=num_threads, fast=fast, warmup=warmup,
+            shard_devices=shard_devices, max_memory=max_memory
+        )
+        return self.model
+
+    def load_draft_model(self, progress=None):
+        """Load the small draft model used by the "assisted" decoding mode"""
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        if self.draft_model is not None:
+            return self.draft_model
+        if not self.is_loaded:
+            raise RuntimeError("Model is not loaded")
+        if not os.path.isdir(self.draft_model_dir):
+            raise FileNotFoundError(f"No draft model found in {self.draft_model_dir}")
+
+        report = progress or (lambda message: None)
+        report(f"Loading draft model from {self.draft_model_dir}...")
+        # The draft must share the main model's tokenizer/vocabulary
+        self.draft_model = AutoModelForCausalLM.from_pretrained(self.draft_model_dir, torch_dtype=torch.bfloat16)
+        self.draft_model.to(self.model.device).eval()
+        return self.draft_model
+
+    @property
+    def speculative(self):
+        return self.decoding_mode in ("prompt-lookup", "assisted")
+
+    def unload(self):
+        """Release the model and tokenizer and free accelerator memory"""
+        with self._lifecycle_lock, self._generate_lock:
+            self._free()
+            self.residency = "unloaded"
+
+    def _used_within(self, seconds):
+        return seconds is not None and self.last_used is not None and time.monotonic() - self.last_used < seconds
+
+    def offload(self, idle_for=None):
+        """Park the weights in CPU RAM to free accelerator memory; returns the new residency.
+
+        The next request moves them back, which is much faster than a reload. CPU and
+        sharded models have nowhere to go, so they are released instead. With
+        `idle_for`, nothing happens if the model was used within that many seconds.
+        """
+        with self._lifecycle_lock, self._generate_lock:
+            if self.residency != "resident" or self._used_within(idle_for):
+                return self.residency
+            if self.device == "cpu" or self._load_args["shard_devices"]:
+                self._free()
+                self.residency = "released"
+                self.metrics.inc("translator_lifecycle_transitions_total", to="released")
+                return self.residency
+            self.model.to("cpu")
+            if self.draft_model is not None:
+                self.draft_model.to("cpu")
+            if self.prefix_cache is not None:
+                self.prefix_cache.clear()  # Its KV tensors live on the accelerator
+            _empty_accelerator_cache()
+            self.residency = "offloaded"
+            self.metrics.inc("translator_lifecycle_transitions_total", to="offloaded")
+            return self.residency
+
+    def release(self, idle_for=None):
+        """Free the weights but remember how they were loaded; the next request reloads them"""
+        with self._lifecycle_lock, self._generate_lock:
+            if self.residency in ("resident", "offloaded") and not self._used_within(idle_for):
+                self._free()
+                self.residency = "released"
+                self.metrics.inc("translator_lifecycle_transitions_total", to="released")
+            return self.residency
+
+    def _free(self):
+        self.model = None
+        self.tokenizer = None
+        self.device = None
+        self.prefix_cache = None
+        self.draft_model = None
+        self.device_map = None
+        self.memory_by_device = {}
+        self.memory_footprint = None
+
+        import gc
+        gc.collect()
+        _empty_accelerator_cache()
+
+    @property
+    def ready(self):
+        """Loaded, or parked/released by the idle policy and able to come back on demand"""
+        return self.is_loaded or self.residency == "released"
+
+    def ensure_resident(self, progress=None):
+        """Bring offloaded or released weights back before generating"""
+        self.last_used = time.monotonic()
+        if self.residency == "resident":
+            return
+        with self._lifecycle_lock:
+            if self.residency == "offloaded":
+                report = progress or (lambda message: None)
+                report(f"Moving model back to {self.device.upper()}...")
+                with self._generate_lock:
+                    self.model.to(self.device)
+                    if self.draft_model is not None:
+                        self.draft_model.to(self.device)
+                    self.residency = "resident"
+                self.metrics.inc("translator_lifecycle_transitions_total", to="resident")
+            elif self.residency == "released":
+                self.load(progress=progress, **self._load_args)
+                self.metrics.inc("translator_lifecycle_transitions_total", to="reloaded")
+            self.last_used = time.monotonic()
+
+    def _generation_kwargs(self, inputs, jobs, cancel_tokens=None):
+        """Optimized generation parameters for complete translations"""
+        from stopping import build_stopping_criteria
+
+        # Stop on EOS, on a new prompt label, on explanation markers, when the length
+        # budget derived from the input is spent or when the row is cancelled
+        stopping_criteria, max_new_tokens = build_stopping_criteria(self.tokenizer, inputs, jobs, cancel_tokens)
+        decoding = {}
+        if self.decoding_mode == "prompt-lookup":
+            # Draft continuations by matching n-grams of the source text
+            decoding["prompt_lookup_num_tokens"] = self.prompt_lookup_num_tokens
+        elif self.decoding_mode == "assisted":
+            decoding["assistant_model"] = self.load_draft_model()
+        return dict(
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=stopping_criteria,
+            eos_token_id=self.tokenizer.eos_token_id,
+            num_return_sequences=1,
+            pad_token_id=self.tokenizer.pad_token_id,
+            early_stopping=False,
+            length_penalty=1.0,  # Encourage longer outputs
+            **decoding,
+            **self.generation_params
+        )
+
+    def _record_decoding(self, generated_tokens, forward_passes):
+        """Track how many tokens each forward pass of the main model produced"""
+        self.decoding_totals["generated_tokens"] += generated_tokens
+        self.decoding_totals["forward_passes"] += forward_passes
+        self.last_decoding_stats = decoding_stats(self.decoding_mode, generated_tokens, forward_passes)
+
+    def cancel(self):
+        """Cancel every queued or running generation; each stops at its next token"""
+        with self._in_flight_lock:
+            tokens = list(self._in_flight)
+        for token in tokens:
+            token.cancel()
+        return len(tokens)
+
+    def _track(self, tokens):
+        """Give every job a CancelToken and register them as in flight"""
+        tokens = [token or CancelToken() for token in tokens]
+        with self._in_flight_lock:
+            self._in_flight.update(tokens)
+        return tokens
+
+    def _untrack(self, tokens):
+        with self._in_flight_lock:
+            self._in_flight.difference_update(tokens)
+
+    def _release_cancelled(self):
+        """Hand the memory of an aborted generation back to the allocator"""
+        import torch
+
+        self.metrics.inc("translator_cancelled_total")
+        if self.device and self.device.startswith("cuda"):
+            torch.cuda.empty_cache()
+
+    def translate(self, input_content, source_lang, target_lang, progress=None, cancel_token=None):
+        """Translate `input_content` and return the cleaned translation.
+
+        Raises TranslationCancelled if `cancel_token` is set before generation finishes.
+        """
+        result = self.translate_batch(
+            [(input_content, source_lang, target_lang)], progress=progress, cancel_tokens=[cancel_token]
+        )[0]
+        if result is None:
+            raise TranslationCancelled()
+        return result
+
+    def translate_batch(self, jobs, progress=None, cancel_tokens=None):
+        """Translate a list of (input_content, source_lang, target_lang) with one generate call.
+
+        `cancel_tokens` optionally pairs a CancelToken with each job; cancelled jobs
+        stop early, are not cached and come back as None.
+        """
+        if not self.ready:
+            raise RuntimeError("Model is not loaded")
+        if not jobs:
+            return []
+        cancel_tokens = list(cancel_tokens or [None] * len(jobs))
+
+        jobs = [(text, resolve_language(source), resolve_language(target)) for text, source, target in jobs]
+        report = progress or (lambda message: None)
+
+        # Serve what we can from the translation memory and only generate the misses
+        keys = [self._cache_key(*job) for job in jobs]
+        results = [self.cache.get(key) if key else None for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if any(keys):
+            hits = sum(1 for key, result in zip(keys, results) if key and result is not None)
+            self.metrics.inc("translator_cache_lookups_total", hits, result="hit")
+            self.metrics.inc("translator_cache_lookups_total", sum(1 for key in keys if key) - hits, result="miss")
+        if not missing:
+            report("Loaded from translation memory")
+            return results
+
+        # Requests cancelled while queued never reach the model
+        missing = [i for i in missing if not (cancel_tokens[i] and cancel_tokens[i].cancelled)]
+        if not missing:
+            return results
+
+        # Translation memory hits above don't need the weights; generation does
+        self.ensure_resident(progress)
+        translations = self._generate_batch([jobs[i] for i in missing], report, [cancel_tokens[i] for i in missing])
+        for i, translation in zip(missing, translations):
+            results[i] = translation
+            if keys[i] and translation is not None:
+                self.cache.put(keys[i], translation)
+        return results
+
+    def _prepare_inputs(self, jobs):
+        """Tokenize jobs; returns (inputs, extra generate kwargs).
+
+        When the prefix cache is enabled and every job shares one language pair, the
+        cached prefix KV is reused for the leading prompt ids that match it, so only
+        the rest is prefilled. Must be called with the generate lock held.
+        """
+        parts = [prompt_parts(text, source, target, self.preamble) for text, source, target in jobs]
+        # Drafting appends several tokens per step, which the shared-prefix path does not expect
+        use_prefix = self.prefix_cache is not None and not self.speculative
+        pairs = {(source["code"], target["code"]) for _, source, target in jobs}
+        prefixes = {prefix for prefix, _ in parts}
+
+        # Left padding keeps the prompts right-aligned, so new tokens start at the same column
+        prompts = [prefix + body for prefix, body in parts]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+
+        if use_prefix and len(pairs) == 1 and len(prefixes) == 1:
+            from prefix_cache import reuse_prefix
+
+            prefix = prefixes.pop()
+            prefix_ids, past = self.prefix_cache.get(self.model, self.tokenizer, (pairs.pop(), prefix), prefix)
+            past_key_values = reuse_prefix(inputs, prefix_ids, past)
+            if past_key_values is not None:
+                return inputs, {"past_key_values": past_key_values}
+        return inputs, {}
+
+    def _generate_batch(self, jobs, report, cancel_tokens=None):
+        cancel_tokens = cancel_tokens or [None] * len(jobs)
+        if self.speculative and len(jobs) > 1:
+            # Assisted and prompt-lookup decoding only support batch size 1
+            results = []
+            for job, token in zip(jobs, cancel_tokens):
+                if token and token.cancelled:
+                    results.append(None)
+                    continue
+                results.extend(self._generate_batch([job], report, [token]))
+            return results
+
+        cancel_tokens = self._track(cancel_tokens)
+        try:
+            return self._generate_tracked(jobs, report, cancel_tokens)
+        finally:
+            self._untrack(cancel_tokens)
+            self.last_used = time.monotonic()
+
+    def _generate_tracked(self, jobs, report, cancel_tokens):
+        report("Preparing input... (1/3)")
+        trace = self.metrics.trace("batch", batch_size=len(jobs), device=self.device, decoding=self.decoding_mode)
+
+        with self._generate_lock:
+            # Everything may have been cancelled while waiting for the model
+            if all(token.cancelled for token in cancel_tokens):
+                return [None] * len(jobs)
+            if self.model is None:
+                raise RuntimeError("Model was unloaded")
+            with trace.span("tokenize"):
+                inputs, extra = self._prepare_inputs(jobs)
+            input_length = inputs.input_ids.shape[1]
+
+            report("Generating translation... (2/3)")
+
+            with self.metrics.profiler(), _ForwardCounter(self.model) as forwards:
+                outputs = self.model.generate(
+                    inputs.input_ids,
+                    attention_mask=inputs.attention_mask,
+                    **extra,
+                    **self._generation_kwargs(inputs, jobs, cancel_tokens)
+                )
+            decode_seconds = forwards.record_spans(trace)
+            tokens_out = (outputs[:, input_length:] != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+            self._record_decoding(sum(tokens_out), forwards.calls)
+
+        report("Decoding output... (3/3)")
+
+        from stopping import truncate_at_stop_strings
+
+        cancelled = [token.cancelled for token in cancel_tokens]
+        if any(cancelled):
+            self._release_cancelled()
+
+        results = []
+        for row, (text, source, target), skip in zip(outputs, jobs, cancelled):
+            if skip:
+                results.append(None)
+                continue
+            # Decode only the new tokens (translation part)
+            with trace.span("detokenize"):
+                translated_text = self.tokenizer.decode(row[input_length:], skip_special_tokens=True)
+
+            # Clean up the translation output
+            with trace.span("cleanup"):
+                translated_text = truncate_at_stop_strings(translated_text).strip()
+                results.append(self._clean_translation_output(translated_text, source, target))
+
+        self.metrics.observe("translator_batch_size", len(jobs), buckets=(1, 2, 4, 8, 16, 32, 64, float("inf")))
+        # Per row: every request in the batch is observed on its own
+        tokens_in = inputs.attention_mask.sum(dim=1).tolist()
+        trace.finish(
+            pair=sorted({f'{source["code"]}-{target["code"]}' for _, source, target in jobs}),
+            requests=len(jobs),
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            tokens_per_second=[count / decode_seconds for count in tokens_out] if decode_seconds > 0 else None,
+        )
+        return results
+
+    def translate_document(self, input_content, source_lang, target_lang, batch_size=8, progress=None, incremental=None):
+        """Translate arbitrarily long text by segmenting it into sentences and batching them.
+
+        With an `IncrementalDocument`, segments unchanged since its last document
+        are reused and only added or edited ones are generated.
+        """
+        from segmentation import segment_document, reassemble
+
+        source_lang = resolve_language(source_lang)
+        target_lang = resolve_language(target_lang)
+        report = progress or (lambda message: None)
+
+        # Incremental documents are diffed sentence by sentence
+        segments, layout = segment_document(input_content, source_lang["code"], merge=incremental is None)
+        pair = (source_lang["code"], target_lang["code"])
+        translations = incremental.reuse(segments, *pair) if incremental is not None else [None] * len(segments)
+        todo = [i for i, translation in enumerate(translations) if translation is None]
+        if len(todo) < len(segments):
+            report(f"Reusing {len(segments) - len(todo)} unchanged segments")
+
+        for start in range(0, len(todo), batch_size):
+            report(f"Translating segments {start + 1}-{min(start + batch_size, len(todo))} of {len(todo)}...")
+            batch = todo[start:start + batch_size]
+            results = self.translate_batch([(segments[i], source_lang, target_lang) for i in batch])
+            # engine.cancel() turns the rows it stopped into None
+            if any(translation is None for translation in results):
+                raise TranslationCancelled()
+            for i, translation in zip(batch, results):
+                translations[i] = translation
+
+        if incremental is not None:
+            incremental.update(segments, translations, *pair)
+        return reassemble(translations, layout, target_lang["code"])
+
+    def translate_stream(self, input_content, source_lang, target_lang, cancel_token=None):
+        """Start a streaming translation and return a TranslationStream of decoded text chunks.
+
+        Chunks are cleaned as they arrive, so prompt labels and trailing explanations
+        never reach the consumer; `stream.result()` is the fully cleaned translation.
+        `stream.cancel()` (or setting `cancel_token`) stops generation at the next
+        token; iterating the stream then raises TranslationCancelled.
+        """
+        from transformers import TextIteratorStreamer
+
+        from stopping import STOP_STRINGS
+
+        self.ensure_resident()
+        if not self.is_loaded:
+            raise RuntimeError("Model is not loaded")
+
+        source_lang = resolve_language(source_lang)
+        target_lang = resolve_language(target_lang)
+        jobs = [(input_content, source_lang, target_lang)]
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        cancel_tokens = self._track([cancel_token])
+        stream = TranslationStream(
+            streamer,
+            cleanup=lambda text: self._finish_stream(text, input_content, source_lang, target_lang),
+            cancel_token=cancel_tokens[0],
+            cleaner=self.postprocessor.pipeline(source_lang, target_lang).stream(STOP_STRINGS)
+        )
+
+        trace = self.metrics.trace(
+            "stream", device=self.device, decoding=self.decoding_mode,
+            pair=[f'{source_lang["code"]}-{target_lang["code"]}']
+        )
+
+        def run():
+            try:
+                with self._generate_lock:
+                    if stream.cancelled:
+                        stream.end()
+                        return
+                    if self.model is None:
+                        raise RuntimeError("Model was unloaded")
+                    stream.start_time = time.perf_counter()
+                    with trace.span("tokenize"):
+                        inputs, extra = self._prepare_inputs(jobs)
+                    with self.metrics.profiler("stream"), _ForwardCounter(self.model) as forwards:
+                        self.model.generate(
+                            inputs.input_ids,
+                            attention_mask=inputs.attention_mask,
+                            streamer=stream,
+                            **extra,
+                            **self._generation_kwargs(inputs, jobs, cancel_tokens)
+                        )
+                    forwards.record_spans(trace)
+                    self._record_decoding(stream.generated_tokens, forwards.calls)
+                if stream.cancelled:
+                    self._release_cancelled()
+                trace.finish(
+                    tokens_in=int(inputs.attention_mask.sum()),
+                    tokens_out=stream.generated_tokens,
+                    tokens_per_second=stream.tokens_per_second,
+                    time_to_first_token=stream.time_to_first_token,
+                    cancelled=stream.cancelled,
+                )
+            except Exception as e:
+                stream.error = e
+                streamer.end()  # Unblock the consumer; the error is re-raised from iteration
+            finally:
+                self._untrack(cancel_tokens)
+                self.last_used = time.monotonic()
+
+        thread = threading.Thread(target=run, name="translate-stream")
+        thread.daemon = True
+        thread.start()
+        return stream
+
+    def _finish_stream(self, text, input_content, source_lang, target_lang):
+        from stopping import truncate_at_stop_strings
+
+        start = time.perf_counter()
+        translated_text = self._clean_translation_output(truncate_at_stop_strings(text).strip(), source_lang, target_lang)
+        self.metrics.observe("translator_span_seconds", time.perf_counter() - start, span="cleanup")
+        key = self._cache_key(input_content, source_lang, target_lang)
+        if key:
+            self.cache.put(key, translated_text)
+        return translated_text
+
+    def _clean_translation_output(self, translated_text, source_lang, target_lang):
+        """Clean up the translation output to remove unwanted artifacts"""
+        return self.postprocessor.pipeline(source_lang, target_lang).clean(translated_text)
+
+
+def _empty_accelerator_cache():
+    """Return cached CUDA blocks to the driver; a no-op until torch has been imported"""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def decoding_stats(mode, generated_tokens, forward_passes):
+    """Summarize speculative decoding against the one-token-per-forward baseline.
+
+    Standard decoding needs one main-model forward per generated token, so
+    `generated / forwards` is the forward-pass speedup and every token beyond one
+    per forward was a drafted token the main model accepted.
+    """
+    forward_passes = max(forward_passes, 1)
+    return {
+        "mode": mode,
+        "generated_tokens": generated_tokens,
+        "forward_passes": forward_passes,
+        "accepted_draft_tokens": max(generated_tokens - forward_passes, 0),
+        "tokens_per_forward": generated_tokens / forward_passes,
+    }
+
+
+class _ForwardCounter:
+    """Count forward calls of a module while the block runs.
+
+    The end of the first call marks the end of prefill, which splits generate time
+    into prefill and decode spans.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.calls = 0
+        self.start = None
+        self.prefill_end = None
+        self.end = None
+        self._handles = []
+
+    def _pre_hook(self, module, args):
+        self.calls += 1
+
+    def _post_hook(self, module, args, output):
+        if self.prefill_end is None:
+            self.prefill_end = time.perf_counter()
+
+    def __enter__(self):
+        self._handles = [
+            self.module.register_forward_pre_hook(self._pre_hook),
+            self.module.register_forward_hook(self._post_hook),
+        ]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.end = time.perf_counter()
+        for handle in self._handles:
+            handle.remove()
+        return False
+
+    def record_spans(self, trace):
+        prefill_end = self.prefill_end or self.end
+        trace.add("prefill", prefill_end - self.start)
+        trace.add("decode", self.end - prefill_end)
+        return self.end - prefill_end
+
+
+class _Timed:
+    """Context manager recording the wall time of a block into `timings[name]`"""
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.timings[self.name] = time.perf_counter() - self.start
+        return False
+
+
+class TranslationStream:
+    """Iterator over decoded text chunks of one generation, with latency statistics.
+
+    The object is handed to `generate` as its streamer: token ids pass through `put`,
+    which timestamps them before forwarding to the wrapped TextIteratorStreamer.
+    """
+
+    def __init__(self, streamer, cleanup=None, cancel_token=None, cleaner=None):
+        self._streamer = streamer
+        self._cleanup = cleanup
+        # Optional postprocess.StreamCleaner applied to chunks before they are yielded
+        self._cleaner = cleaner
+        self.cancel_token = cancel_token or CancelToken()
+        self._chunks = []
+        self._prompt_seen = False
+        self.start_time = None
+        self.first_token_time = None
+        self.end_time = None
+        self.generated_tokens = 0
+        self.error = None
+        # The wrapped streamer can only be iterated once
+        self._consumed = False
+
+    # Streamer interface used by generate()
+
+    def put(self, value):
+        # The first call carries the prompt ids
+        if not self._prompt_seen:
+            self._prompt_seen = True
+        else:
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+            self.generated_tokens += value.numel()
+        self._streamer.put(value)
+
+    def end(self):
+        self.end_time = time.perf_counter()
+        self._streamer.end()
+
+    # Consumer interface
+
+    def cancel(self):
+        """Stop generation at the next token"""
+        self.cancel_token.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def __iter__(self):
+        for chunk in self._streamer:
+            if chunk:
+                self._chunks.append(chunk)
+                if self._cleaner is not None:
+                    chunk = self._cleaner.feed(chunk)
+                if chunk:
+                    yield chunk
+        self._consumed = True
+        if self._cleaner is not None:
+            tail = self._cleaner.flush()
+            if tail:
+                yield tail
+        self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        if self.error is not None:
+            raise self.error
+        if self.cancelled:
+            raise TranslationCancelled()
+
+    @property
+    def text(self):
+        """Raw text received so far, before cleanup"""
+        return "".join(self._chunks)
+
+    def result(self):
+        """Drain the stream unless it was already iterated, and return the cleaned translation"""
+        if self._consumed:
+            self._raise_if_failed()
+        else:
+            for _ in self:
+                pass
+        return self._cleanup(self.text) if self._cleanup else self.text.strip()
+
+    @property
+    def time_to_first_token(self):
+        if self.start_time is None or self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def tokens_per_second(self):
+        """Decode throughput, measured from the first generated token"""
+        if self.first_token_time is None or self.generated_tokens < 2:
+            return None
+        end = self.end_time or time.perf_counter()
+        elapsed = end - self.first_token_time
+        return (self.generated_tokens - 1) / elapsed if elapsed > 0 else None
@@ -0,0 +1,121 @@
+"""Zero-copy model loading from memory-mapped safetensors files.
+
+Tensors are created directly on top of a private (copy-on-write) mapping of the
+checkpoint, so on CPU the weights stay backed by the page cache: a second load, or
+a second process loading the same file, reuses the pages instead of reading and
+copying 14 GB again.
+"""
+import json
+import mmap
+import os
+import struct
+
+import torch
+
+_DTYPES = {
+    "BF16": torch.bfloat16,
+    "F16": torch.float16,
+    "F32": torch.float32,
+    "F64": torch.float64,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "I16": torch.int16,
+    "I32": torch.int32,
+    "I64": torch.int64,
+    "BOOL": torch.bool,
+}
+
+
+def checkpoint_files(model_dir):
+    """Safetensors files of a checkpoint, following a shard index when present"""
+    index_path = os.path.join(model_dir, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as f:
+            weight_map = json.load(f)["weight_map"]
+        return [os.path.join(model_dir, name) for name in sorted(set(weight_map.values()))]
+    return [os.path.join(model_dir, "model.safetensors")]
+
+
+def mmap_safetensors(path):
+    """Return {name: tensor} whose storage is a view of the mapped file"""
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        # ACCESS_COPY maps privately: pages are shared with the page cache until written
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + begin)
+        tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+
+def load_state_dict(model_dir, dtype=None):
+    """Memory-map every checkpoint file; only tensors of a different dtype are copied"""
+    state_dict = {}
+    for path in checkpoint_files(model_dir):
+        state_dict.update(mmap_safetensors(path))
+    if dtype is not None:
+        for name, tensor in state_dict.items():
+            if tensor.is_floating_point() and tensor.dtype != dtype:
+                state_dict[name] = tensor.to(dtype)
+    return state_dict
+
+
+def assign_weights(model, state_dict):
+    """Attach the mapped tensors to a model built under init_empty_weights"""
+    result = model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    still_empty = [name for name, param in model.named_parameters() if param.device.type == "meta"]
+    if still_empty:
+        raise RuntimeError(f"Checkpoint is missing weights for: {', '.join(still_empty[:5])}")
+    return result
+
+
+def shard_device_map(model, devices, max_memory=None, dtype=torch.bfloat16):
+    """Device map splitting `model`'s decoder layers across `devices` (e.g. cuda:0, cuda:1, cpu).
+
+    `max_memory` maps each device to a byte budget; by default all free memory of
+    the listed devices is used, balanced so every GPU gets a similar share of layers.
+    """
+    from accelerate import infer_auto_device_map
+    from accelerate.utils import get_balanced_memory, get_max_memory
+
+    # accelerate keys GPUs by index and the host by "cpu"
+    keys = [int(device.split(":")[1]) if device.startswith("cuda") else "cpu" for device in devices]
+    if max_memory is None:
+        available = get_max_memory()
+        max_memory = {key: available[key] for key in keys if key in available}
+    else:
+        max_memory = {
+            int(device.split(":")[1]) if device.startswith("cuda") else "cpu": budget
+            for device, budget in max_memory.items()
+        }
+
+    no_split = model._no_split_modules
+    if sum(1 for key in max_memory if key != "cpu") > 1:
+        max_memory = get_balanced_memory(model, max_memory=max_memory, no_split_module_classes=no_split, dtype=dtype)
+    return infer_auto_device_map(model, max_memory=max_memory, no_split_module_classes=no_split, dtype=dtype)
+
+
+def warm_up(model, tokenizer):
+    """Run a tiny generation so kernels, allocators and caches are ready for real requests"""
+    inputs = tokenizer("English: Hello\n中文：", return_tensors="pt").to(model.device)
+    with torch.inference_mode():
+        model.generate(
+            inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_new_tokens=2,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id,
+        )
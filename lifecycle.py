@@ -0,0 +1,132 @@
+"""Model lifecycle: memory reporting and idle offload/release.
+
+An `IdleMonitor` watches an engine and, after `timeout` seconds without a
+translation, either moves its weights to CPU RAM ("offload", freeing the GPU) or
+frees them entirely ("release"). The engine brings them back on the next request;
+a released model reloads through the memory-mapped fast path, which is mostly
+served from the OS page cache.
+
+Nothing here imports torch; accelerator memory is only reported once torch has
+been loaded by the engine.
+"""
+import os
+import sys
+import threading
+import time
+
+IDLE_ACTIONS = {
+    "keep": "Keep loaded",
+    "offload": "Offload to CPU",
+    "release": "Free memory",
+}
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+
+
+def process_rss_bytes():
+    """Current resident set size of this process, or None if unknown"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    # Without /proc the best we have is the peak
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """Highest resident set size this process has reached, or None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_report(devices=()):
+    """Resident and peak memory of the process and of the given CUDA devices.
+
+    Only `devices` are queried so that reporting never creates a CUDA context on a
+    GPU the model doesn't use.
+    """
+    report = {"rss_bytes": process_rss_bytes(), "peak_rss_bytes": peak_rss_bytes(), "devices": {}}
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return report
+    for device in sorted({str(device) for device in devices}):
+        if not device.startswith("cuda"):
+            continue
+        report["devices"][device] = {
+            "allocated_bytes": torch.cuda.memory_allocated(device),
+            "reserved_bytes": torch.cuda.memory_reserved(device),
+            "peak_bytes": torch.cuda.max_memory_allocated(device),
+        }
+    return report
+
+
+class IdleMonitor:
+    """Offload or release an engine's weights once it has been idle for `timeout` seconds.
+
+    `action` and `timeout` may be changed while the monitor runs. `on_change` is
+    called with the engine's new residency after every transition.
+    """
+
+    def __init__(self, engine, timeout=DEFAULT_IDLE_TIMEOUT, action="offload", interval=None, on_change=None):
+        if action not in IDLE_ACTIONS:
+            raise ValueError(f"Unknown idle action: {action}")
+        self.engine = engine
+        self.timeout = timeout
+        self.action = action
+        self.interval = interval
+        self.on_change = on_change
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="idle-monitor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def idle_seconds(self):
+        if self.engine.last_used is None:
+            return 0.0
+        return time.monotonic() - self.engine.last_used
+
+    def check(self):
+        """Apply the idle action if it is due; returns the new residency or None"""
+        if self.action == "keep" or self.engine.residency != "resident":
+            return None
+        if self.idle_seconds() < self.timeout:
+            return None
+        # The engine re-checks under its lock, so a request arriving now wins
+        if self.action == "offload":
+            residency = self.engine.offload(idle_for=self.timeout)
+        else:
+            residency = self.engine.release(idle_for=self.timeout)
+        if residency == "resident":
+            return None
+        if self.on_change is not None:
+            self.on_change(residency)
+        return residency
+
+    def _run(self):
+        # Checking a few times per timeout keeps the overshoot small without busy-waiting
+        interval = self.interval or max(1.0, min(30.0, self.timeout / 4))
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception:
+                # A failed transition leaves the model where it was; try again next time
+                pass
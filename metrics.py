@@ -0,0 +1,198 @@
+"""Lightweight instrumentation for the translation hot path.
+
+Counters and histograms are kept in a `Metrics` registry and rendered in the
+Prometheus text format. Each request gets a `Trace` with spans (tokenize, prefill,
+decode, detokenize, cleanup); finished traces are logged as one JSON object per
+line on the "translator.metrics" logger. `profile_next(n)` runs the torch profiler
+around the next n generate calls.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("translator.metrics")
+
+# Seconds; spans range from sub-millisecond cleanup to multi-minute CPU decodes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf"))
+# Tokens and tokens/sec
+COUNT_BUCKETS = (1, 4, 16, 64, 128, 256, 512, 1024, 2048, 4096, float("inf"))
+
+_HELP = {
+    "translator_span_seconds": "Time spent in each phase of a translation",
+    "translator_tokens_in": "Prompt tokens per request",
+    "translator_tokens_out": "Generated tokens per request",
+    "translator_tokens_per_second": "Decode throughput per request",
+    "translator_queue_wait_seconds": "Time a request waited in the batch scheduler",
+    "translator_batch_size": "Requests per generate call",
+    "translator_requests_total": "Translation requests handled by the engine",
+    "translator_cache_lookups_total": "Translation memory lookups by result",
+    "translator_cancelled_total": "Generations stopped early by cancellation",
+    "translator_lifecycle_transitions_total": "Model offloads and releases by resulting residency",
+}
+
+
+def configure_json_log(path):
+    """Append finished traces to `path` as JSON lines"""
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return handler
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._profile_remaining = 0
+        self._profile_dir = None
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+            if key not in series:
+                series[key] = _Histogram(buckets)
+            series[key].observe(value)
+
+    def trace(self, kind, **fields):
+        return Trace(self, kind, **fields)
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in _HELP:
+                    lines.append(f"# HELP {name} {_HELP[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in _HELP:
+                    lines.append(f"# HELP {name} {_HELP[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(labels, {'le': le})} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # Torch profiler
+
+    def profile_next(self, count, output_dir="profiles"):
+        """Capture a torch profiler trace for each of the next `count` generate calls"""
+        with self._lock:
+            self._profile_remaining = count
+            self._profile_dir = output_dir
+
+    @contextmanager
+    def profiler(self, name="generate"):
+        with self._lock:
+            active = self._profile_remaining > 0
+            if active:
+                self._profile_remaining -= 1
+                output_dir = self._profile_dir
+        if not active:
+            yield
+            return
+
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        os.makedirs(output_dir, exist_ok=True)
+        with profile(activities=activities, record_shapes=True) as prof:
+            yield
+        path = os.path.join(output_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{id(prof):x}.json")
+        prof.export_chrome_trace(path)
+        logger.info(json.dumps({"event": "profile", "path": path}))
+
+
+class Trace:
+    """Spans and fields of one request; `finish` records histograms and logs a JSON line"""
+
+    def __init__(self, metrics, kind, **fields):
+        self.metrics = metrics
+        self.kind = kind
+        self.fields = fields
+        self.spans = {}
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def finish(self, **fields):
+        """Record the trace; token fields may be lists with one value per request of a batch"""
+        self.fields.update(fields)
+        for name, seconds in self.spans.items():
+            self.metrics.observe("translator_span_seconds", seconds, span=name)
+        for name in ("tokens_in", "tokens_out", "tokens_per_second"):
+            value = self.fields.get(name)
+            if value is None:
+                continue
+            for item in value if isinstance(value, (list, tuple)) else [value]:
+                self.metrics.observe(f"translator_{name}", item, buckets=COUNT_BUCKETS)
+        self.metrics.inc("translator_requests_total", value=self.fields.get("requests", 1), kind=self.kind)
+
+        if logger.isEnabledFor(logging.INFO):
+            record = {"ts": self.started, "kind": self.kind, "spans": self.spans}
+            record.update(self.fields)
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+# Process-wide default registry
+REGISTRY = Metrics()
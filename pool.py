@@ -0,0 +1,412 @@
+"""Serve one workload from several model replicas.
+
+A `ReplicaPool` load-balances requests over `BatchScheduler`s, each driving its
+own model copy, and exposes the same submit/translate/cancel interface as a single
+scheduler, so the server and GUI code don't care how many replicas there are:
+
+    pool = device_pool(["cuda:0", "cuda:1"])              # one replica per GPU
+    pool = cpu_process_pool(4)                            # 4 CPU processes, cores split between them
+
+GPU replicas live in this process and generate concurrently. CPU replicas run in
+child processes with pinned thread counts and core affinity, so they don't fight
+over the same cores; their weights are shared through the page cache of the
+memory-mapped checkpoint.
+"""
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+
+from engine import CancelToken, TranslationCancelled, TranslationEngine, resolve_language
+from metrics import REGISTRY
+from scheduler import BatchScheduler, ClientRegistry
+
+
+class ReplicaPool:
+    """Route each request to the replica with the least queued plus running work"""
+
+    def __init__(self, replicas):
+        if not replicas:
+            raise ValueError("A replica pool needs at least one replica")
+        self.replicas = list(replicas)
+        self.clients = ClientRegistry()
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        """The first replica's engine, used for health reporting"""
+        return self.replicas[0].engine
+
+    @property
+    def engines(self):
+        return [replica.engine for replica in self.replicas]
+
+    def start(self):
+        for replica in self.replicas:
+            replica.start()
+
+    def stop(self):
+        for replica in self.replicas:
+            replica.stop()
+
+    def unload(self):
+        for replica in self.replicas:
+            replica.engine.unload()
+
+    def _pick(self):
+        with self._lock:
+            # Ties go to the next replica in rotation so idle replicas share the load
+            offset = next(self._rotation)
+            count = len(self.replicas)
+            candidates = [self.replicas[(offset + i) % count] for i in range(count)]
+            return min(candidates, key=lambda replica: replica.load())
+
+    def submit(self, input_content, source_lang, target_lang, cancel_token=None, client_id=None):
+        future = self._pick().submit(input_content, source_lang, target_lang, cancel_token)
+        if client_id is not None:
+            self.clients.track(client_id, future)
+        return future
+
+    def translate(self, input_content, source_lang, target_lang, timeout=None, cancel_token=None, client_id=None):
+        future = self.submit(input_content, source_lang, target_lang, cancel_token, client_id)
+        return future.result(timeout=timeout)
+
+    def translate_stream(self, input_content, source_lang, target_lang, cancel_token=None):
+        return self._pick().translate_stream(input_content, source_lang, target_lang, cancel_token)
+
+    def supersede(self, client_id, cancel_token):
+        self.clients.supersede(client_id, cancel_token)
+
+    def release(self, client_id, cancel_token):
+        self.clients.release(client_id, cancel_token)
+
+    def cancel(self, client_id=None):
+        if client_id is not None:
+            self.clients.cancel(client_id)
+            return
+        for replica in self.replicas:
+            replica.cancel()
+
+    def pending(self):
+        return sum(replica.pending() for replica in self.replicas)
+
+    def stats(self):
+        """Per-replica device, queue depth, utilization and weight memory"""
+        return [replica.stats() for replica in self.replicas]
+
+
+def device_pool(devices, model_dir=None, engine_kwargs=None, load_kwargs=None, scheduler_kwargs=None, progress=None):
+    """Load one in-process replica per device (e.g. every CUDA device) and pool them"""
+    report = progress or (lambda message: None)
+    replicas = []
+    for device in devices:
+        engine = TranslationEngine(model_dir, **(engine_kwargs or {}))
+        engine.load(device, progress=lambda message, device=device: report(f"[{device}] {message}"), **(load_kwargs or {}))
+        replicas.append(BatchScheduler(engine, **(scheduler_kwargs or {})))
+    return ReplicaPool(replicas)
+
+
+def cpu_process_pool(count, model_dir=None, threads_per_replica=None, engine_kwargs=None, load_kwargs=None,
+                     scheduler_kwargs=None, progress=None):
+    """Start `count` CPU replicas in child processes, each pinned to its own slice of cores"""
+    try:
+        cores = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = list(range(os.cpu_count() or 1))
+    threads = threads_per_replica or max(1, len(cores) // count)
+
+    engines = []
+    for i in range(count):
+        # Disjoint core sets when there are enough cores, otherwise let the OS schedule
+        replica_cores = cores[i * threads:(i + 1) * threads]
+        engine = ProcessEngine(
+            model_dir, num_threads=threads, cores=replica_cores if len(replica_cores) == threads else None,
+            engine_kwargs=engine_kwargs, load_kwargs=load_kwargs, name=f"cpu-{i}"
+        )
+        engine.start()
+        engines.append(engine)
+
+    report = progress or (lambda message: None)
+    for engine in engines:
+        engine.wait_loaded()
+        report(f"[{engine.name}] loaded with {threads} threads")
+    return ReplicaPool([BatchScheduler(engine, **(scheduler_kwargs or {})) for engine in engines])
+
+
+class _SharedCancel:
+    """CancelToken backed by a multiprocessing.Event, so the parent can stop a child's batch"""
+
+    def __init__(self, event):
+        self._event = event
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+def _replica_main(conn, abort, model_dir, num_threads, cores, engine_kwargs, load_kwargs):
+    """Child process: load an engine on CPU and answer batch and stream requests over `conn`"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    try:
+        engine = TranslationEngine(model_dir, **engine_kwargs)
+        engine.load("cpu", num_threads=num_threads, **load_kwargs)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ok", {
+        "memory_footprint": engine.memory_footprint,
+        "process_rss": engine.process_rss,
+        "load_timings": engine.load_timings,
+        "cpu_profile": engine.cpu_profile,
+    }))
+
+    token = _SharedCancel(abort)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        kind, payload = message
+        # A cancel that arrived while idle must not abort this request
+        abort.clear()
+        try:
+            if kind == "stream":
+                _stream_to(conn, engine, payload, token)
+                continue
+            results = engine.translate_batch(payload, cancel_tokens=[token] * len(payload))
+            conn.send(("ok", (results, engine.decoding_totals)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _stream_to(conn, engine, job, token):
+    """Child process: send a streamed translation as ("chunk", text) messages and a final reply"""
+    stream = engine.translate_stream(*job, cancel_token=token)
+    try:
+        for chunk in stream:
+            conn.send(("chunk", chunk))
+        conn.send(("ok", {
+            "translation": stream.result(),
+            "time_to_first_token": stream.time_to_first_token,
+            "tokens_per_second": stream.tokens_per_second,
+            "decoding_totals": engine.decoding_totals,
+        }))
+    except TranslationCancelled:
+        conn.send(("cancelled", None))
+
+
+class ProcessEngine:
+    """A TranslationEngine on CPU in a child process, with the API a BatchScheduler needs.
+
+    A running batch is aborted once every row in it is cancelled; cancelling only
+    some rows lets the batch finish and drops their results. Streams are relayed
+    chunk by chunk over the same pipe. Translation memory is not available across
+    the process boundary.
+    """
+
+    def __init__(self, model_dir=None, num_threads=None, cores=None, engine_kwargs=None, load_kwargs=None,
+                 name="cpu"):
+        self.model_name = model_dir
+        self.num_threads = num_threads
+        self.cores = cores
+        self.engine_kwargs = dict(engine_kwargs or {})
+        self.load_kwargs = dict(load_kwargs or {})
+        self.name = name
+        self.device = "cpu"
+        self.cpu_profile = self.load_kwargs.get("cpu_profile", "bf16")
+        self.cache = None
+        self.prefix_cache = None
+        self.metrics = REGISTRY
+        self.decoding_totals = {"generated_tokens": 0, "forward_passes": 0}
+        self.memory_footprint = None
+        self.memory_by_device = {}
+        self.residency = "unloaded"
+        self.process_rss = None
+        self.load_timings = {}
+        self._process = None
+        self._conn = None
+        self._abort = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    @property
+    def ready(self):
+        return self._loaded
+
+    def start(self):
+        # Spawn, not fork: a forked child would inherit the parent's torch thread pools
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._abort = context.Event()
+        self._process = context.Process(
+            target=_replica_main, name=f"translator-{self.name}", daemon=True,
+            args=(child_conn, self._abort, self.model_name, self.num_threads, self.cores,
+                  self.engine_kwargs, self.load_kwargs)
+        )
+        self._process.start()
+        child_conn.close()
+
+    def wait_loaded(self):
+        try:
+            status, payload = self._conn.recv()
+        except EOFError:
+            status, payload = "error", f"process exited with code {self._process.exitcode}"
+        if status == "error":
+            raise RuntimeError(f"Replica {self.name} failed to load: {payload}")
+        self.memory_footprint = payload["memory_footprint"]
+        self.memory_by_device = {"cpu": payload["memory_footprint"]}
+        self.process_rss = payload["process_rss"]
+        self.load_timings = payload["load_timings"]
+        self.cpu_profile = payload["cpu_profile"]
+        self._loaded = True
+        self.residency = "resident"
+
+    def load(self, progress=None):
+        self.start()
+        self.wait_loaded()
+
+    def translate_batch(self, jobs, progress=None, cancel_tokens=None):
+        if not self._loaded:
+            raise RuntimeError("Model is not loaded")
+        cancel_tokens = list(cancel_tokens or [None] * len(jobs))
+        live = [i for i, token in enumerate(cancel_tokens) if not (token and token.cancelled)]
+        results = [None] * len(jobs)
+        if not live:
+            return results
+
+        jobs = [(text, resolve_language(source), resolve_language(target)) for text, source, target in jobs]
+        with self._lock:
+            self._conn.send(("batch", [jobs[i] for i in live]))
+            status, payload = self._receive(lambda: all(cancel_tokens[i] and cancel_tokens[i].cancelled for i in live))
+        if status == "error":
+            raise RuntimeError(payload)
+
+        translations, self.decoding_totals = payload
+        for i, translation in zip(live, translations):
+            if not (cancel_tokens[i] and cancel_tokens[i].cancelled):
+                results[i] = translation
+        return results
+
+    def _receive(self, cancelled):
+        """Next reply from the child; aborts its work while `cancelled()` is true. Hold the lock."""
+        while not self._conn.poll(0.05):
+            if cancelled():
+                self._abort.set()
+        return self._conn.recv()
+
+    def cancel(self):
+        """Abort the batch or stream running in the child, if any"""
+        if self._abort is not None:
+            self._abort.set()
+        return 0
+
+    def translate_stream(self, input_content, source_lang, target_lang, cancel_token=None):
+        """Stream a translation from the child; returns a ProcessStream"""
+        if not self._loaded:
+            raise RuntimeError("Model is not loaded")
+        job = (input_content, resolve_language(source_lang), resolve_language(target_lang))
+        return ProcessStream(self, job, cancel_token)
+
+    def unload(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=10)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+        self._loaded = False
+        self.residency = "unloaded"
+
+
+class ProcessStream:
+    """A translation streamed from a ProcessEngine child, with TranslationStream's consumer interface.
+
+    A relay thread holds the engine's pipe until the child has finished, so batches
+    for the same replica wait behind the stream.
+    """
+
+    def __init__(self, engine, job, cancel_token=None):
+        self.cancel_token = cancel_token or CancelToken()
+        self.time_to_first_token = None
+        self.tokens_per_second = None
+        self.error = None
+        self._translation = None
+        self._cancelled = False
+        self._chunks = queue.Queue()
+        self._consumed = False
+        thread = threading.Thread(target=self._relay, args=(engine, job), name=f"stream-{engine.name}")
+        thread.daemon = True
+        thread.start()
+
+    def _relay(self, engine, job):
+        try:
+            with engine._lock:
+                engine._conn.send(("stream", job))
+                while True:
+                    status, payload = engine._receive(lambda: self.cancel_token.cancelled)
+                    if status != "chunk":
+                        break
+                    self._chunks.put(payload)
+            if status == "ok":
+                self._translation = payload["translation"]
+                self.time_to_first_token = payload["time_to_first_token"]
+                self.tokens_per_second = payload["tokens_per_second"]
+                engine.decoding_totals = payload["decoding_totals"]
+            elif status == "cancelled":
+                self._cancelled = True
+            else:
+                self.error = RuntimeError(payload)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._chunks.put(None)
+
+    def cancel(self):
+        """Stop generation at the next token"""
+        self.cancel_token.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled or self.cancel_token.cancelled
+
+    def __iter__(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        self._consumed = True
+        self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        if self.error is not None:
+            raise self.error
+        if self.cancelled:
+            raise TranslationCancelled()
+
+    def result(self):
+        """Drain the stream unless it was already iterated, and return the cleaned translation"""
+        if self._consumed:
+            self._raise_if_failed()
+        else:
+            for _ in self:
+                pass
+        return self._translation
@@ -0,0 +1,281 @@
+"""Post-processing of generated translations.
+
+Every language pair gets a `CleanupPipeline` compiled once from its rules:
+
+- markers: text the model appends after the translation (explanations, chain of
+  thought); the output is cut at the first one
+- prefixes: prompt labels the model sometimes repeats at the start
+- replacements: literal fixes, e.g. words the model glued together
+
+All markers are found by one precompiled alternation, and the replacements and
+whitespace fixes are applied in a single `re.sub` pass, so cleanup is linear in the
+output length. Newlines are kept: runs of spaces and tabs collapse to one space and
+runs of blank lines to a single empty line.
+
+Rules start from DEFAULT_RULES and can be extended from a JSON file:
+
+    {
+        "*":     {"markers": ["Explanation:"]},
+        "*-en":  {"replacements": {"inorder": "in order"}},
+        "zh-en": {"prefixes": ["译文："], "min_length": 10}
+    }
+
+Sections apply from least to most specific: "*", "<src>-*", "*-<tgt>", "<src>-<tgt>".
+Lists are appended, replacements merged and scalars overridden.
+"""
+import hashlib
+import json
+import re
+
+# Strong explanation markers that definitely indicate non-translation content
+STRONG_EXPLANATION_MARKERS = [
+    '[COT]', '[cot]', 'This is an advertisement', 'The purpose here should be',
+    'Firstly，the brand name', 'Secondly，the model number', 'Thirdly，the term',
+    'Fourthly，the phrase', 'Finally, the overall tone'
+]
+
+DEFAULT_RULES = {
+    "*": {
+        "markers": STRONG_EXPLANATION_MARKERS,
+        "prefixes": ["翻译成英文：", "英文：", "中文：", "English:"],
+        # Shorter results are suspicious; fall back to the raw output instead
+        "min_length": 20,
+    },
+    # Only fix obvious concatenation errors
+    "*-en": {
+        "replacements": {
+            "supportfor": "support for",
+            "creatorsand": "creators and",
+            "placingan": "placing an",
+            "researchng": "researching",
+            "furtherabout": "further about",
+            "thismodelandloveditmoreandenmore": "this model and loved it more and more",
+            "askingthe": "asking the",
+            "salesmaniftherewasanyexhibitioncarbut": "salesman if there was any exhibition car but",
+            "waitednearly": "waited nearly",
+            "monthsforone": "months for one",
+        },
+    },
+}
+
+RULE_KEYS = ("markers", "prefixes", "replacements", "min_length")
+
+# Used when cleanup leaves nothing at all
+FAILED_TRANSLATION = "Translation failed - please try again with different text."
+
+
+def load_rules(path):
+    """Read a rules file and check that every section only uses known keys"""
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    for section, entries in rules.items():
+        unknown = set(entries) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown cleanup rule in section {section!r}: {', '.join(sorted(unknown))}")
+    return rules
+
+
+def merge_rules(base, extra):
+    """Combine two rule sets section by section"""
+    merged = {section: dict(entries) for section, entries in base.items()}
+    for section, entries in extra.items():
+        _merge_section(merged.setdefault(section, {}), entries)
+    return merged
+
+
+def _merge_section(target, entries):
+    for key, value in entries.items():
+        if key in ("markers", "prefixes"):
+            target[key] = list(target.get(key, [])) + list(value)
+        elif key == "replacements":
+            target[key] = dict(target.get(key, {}), **value)
+        else:
+            target[key] = value
+
+
+def compile_alternation(strings):
+    """One regex matching any of `strings`; longest first so overlapping entries match fully"""
+    strings = sorted(set(strings), key=len, reverse=True)
+    if not strings:
+        return None
+    return re.compile("|".join(re.escape(s) for s in strings))
+
+
+def _unwrap_quotes(text):
+    # Only when the quotes wrap the entire text
+    for quote in ('"', "'"):
+        if text.startswith(quote) and text.endswith(quote):
+            text = text[1:-1].strip()
+    return text
+
+
+class CleanupPipeline:
+    """Compiled cleanup for one language pair"""
+
+    def __init__(self, markers=(), prefixes=(), replacements=None, min_length=0):
+        self.markers = list(markers)
+        self.prefixes = list(prefixes)
+        self.replacements = dict(replacements or {})
+        self.min_length = min_length
+
+        self._markers = compile_alternation(self.markers)
+        labels = compile_alternation(self.prefixes)
+        self._prefixes = re.compile(rf"\s*(?:(?:{labels.pattern})\s*)*" if labels else r"\s*")
+        # Alternatives are tried in order: replacements, then a newline run with the
+        # spaces around it, then a run of spaces or tabs
+        keys = compile_alternation(self.replacements)
+        rewrite = r"(?P<newline>[^\S\n]*\n\s*)|(?P<space>[^\S\n]+)"
+        if keys:
+            rewrite = rf"(?P<key>{keys.pattern})|" + rewrite
+        self._rewrite = re.compile(rewrite)
+
+    def truncate(self, text):
+        """Cut `text` at the earliest marker"""
+        if self._markers is None:
+            return text
+        match = self._markers.search(text)
+        return text[:match.start()] if match else text
+
+    def strip_prefixes(self, text):
+        """Drop leading whitespace and any prompt labels at the start"""
+        return text[self._prefixes.match(text).end():]
+
+    def rewrite(self, text):
+        """Apply the replacements and whitespace fixes in one pass"""
+        return self._rewrite.sub(self._replace, text)
+
+    def _replace(self, match):
+        if match.lastgroup == "key":
+            return self.replacements[match.group()]
+        if match.lastgroup == "newline":
+            return "\n\n" if match.group().count("\n") > 1 else "\n"
+        return " "
+
+    def clean(self, text):
+        """Clean one complete translation"""
+        stripped = self.strip_prefixes(self.truncate(text).strip()).strip()
+        cleaned = self.rewrite(_unwrap_quotes(stripped)).strip()
+        if len(cleaned) < self.min_length:
+            # Suspiciously short; keep any quotes, which may be the whole translation,
+            # but still honour the markers and replacements
+            fallback = self.rewrite(stripped).strip()
+            return fallback or FAILED_TRANSLATION
+        return cleaned
+
+    def stream(self, stop_strings=()):
+        """A StreamCleaner for one streamed translation; `stop_strings` also cut the output"""
+        return StreamCleaner(self, stop_strings)
+
+
+class StreamCleaner:
+    """Clean a translation chunk by chunk while it is being generated.
+
+    `feed` returns the part of the cleaned output that can no longer change. Text
+    that may still turn out to be the start of a marker, a replacement or a longer
+    whitespace run is held back until the next chunk or `flush`. Only that tail is
+    ever rescanned, so the total work stays linear in the output length. The
+    pieces add up to `pipeline.clean` minus its quote unwrapping and short-output
+    fallback, which need the whole text.
+    """
+
+    def __init__(self, pipeline, stop_strings=()):
+        self.pipeline = pipeline
+        markers = pipeline.markers + list(stop_strings)
+        self._markers = compile_alternation(markers)
+        self._marker_holdback = max((len(marker) for marker in markers), default=1) - 1
+        self._holdback = max([self._marker_holdback] + [len(key) - 1 for key in pipeline.replacements])
+        self._prefix_length = max((len(prefix) for prefix in pipeline.prefixes), default=0)
+        self._buffer = ""
+        self._searched = 0
+        self._started = False
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done:
+            return ""
+        self._buffer += chunk
+        if self._markers is not None:
+            match = self._markers.search(self._buffer, self._searched)
+            if match:
+                self._buffer = self._buffer[:match.start()]
+                return self.flush()
+        text = self._emit(final=False)
+        # Anything emitted was checked; a marker can only start in the held-back tail
+        self._searched = max(0, len(self._buffer) - self._marker_holdback)
+        return text
+
+    def flush(self):
+        """Emit everything still held back; call once generation has ended"""
+        if self.done:
+            return ""
+        self.done = True
+        return self._emit(final=True)
+
+    def _emit(self, final):
+        buffer = self._buffer
+        if not self._started:
+            match = self.pipeline._prefixes.match(buffer)
+            # Until enough text follows, the rest could still be another prompt label
+            if not final and len(buffer) - match.end() < max(self._prefix_length, 1):
+                return ""
+            buffer = buffer[match.end():]
+            self._started = True
+        if final:
+            self._buffer = ""
+            return self.pipeline.rewrite(buffer).rstrip()
+
+        cut = len(buffer) - self._holdback
+        pieces = []
+        pos = 0
+        for match in self.pipeline._rewrite.finditer(buffer):
+            # A match touching the end of the buffer may still grow
+            if match.start() >= cut or match.end() == len(buffer):
+                cut = min(cut, match.start())
+                break
+            pieces.append(buffer[pos:match.start()])
+            pieces.append(self.pipeline._replace(match))
+            pos = match.end()
+        if cut > pos:
+            pieces.append(buffer[pos:cut])
+            pos = cut
+        self._buffer = buffer[pos:]
+        return "".join(pieces)
+
+
+class Postprocessor:
+    """Cleanup rules for every language pair; each pair's pipeline is compiled on first use"""
+
+    def __init__(self, rules=None):
+        self.rules = merge_rules(DEFAULT_RULES, rules or {})
+        # Part of translation memory keys, so changing the rules invalidates cached output
+        payload = json.dumps(self.rules, sort_keys=True, ensure_ascii=False)
+        self.fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        self._pipelines = {}
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_rules(path))
+
+    def rules_for(self, source_code, target_code):
+        """Merged rules of every section that applies to the pair"""
+        merged = {}
+        for section in ("*", f"{source_code}-*", f"*-{target_code}", f"{source_code}-{target_code}"):
+            _merge_section(merged, self.rules.get(section, {}))
+        return merged
+
+    def pipeline(self, source_lang, target_lang):
+        """CleanupPipeline for resolved source/target language entries"""
+        key = (source_lang["code"], target_lang["code"])
+        pipeline = self._pipelines.get(key)
+        if pipeline is None:
+            rules = self.rules_for(*key)
+            # The model may echo either prompt label
+            labels = [f'{source_lang["name"]}:', f'{target_lang["name"]}:']
+            pipeline = CleanupPipeline(
+                markers=rules.get("markers", ()),
+                prefixes=labels + rules.get("prefixes", []),
+                replacements=rules.get("replacements"),
+                min_length=rules.get("min_length", 0),
+            )
+            self._pipelines[key] = pipeline
+        return pipeline
@@ -0,0 +1,102 @@
+"""Reuse the KV cache of shared prompt prefixes across translations.
+
+Every prompt for a language pair starts with the same text: the optional
+instruction preamble plus the source label (`中文：`, `English: `, ...). Its
+past-key-values are computed once per pair and kept in a bounded LRU, so each
+request only prefills its own tokens. Off by default (`use_prefix_cache`).
+"""
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class PrefixCache:
+    """LRU of (prefix token ids, legacy past-key-values) keyed by (source, target, prefix text)"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _compute(self, model, tokenizer, prefix):
+        ids = tokenizer(prefix, return_tensors="pt").input_ids.to(model.device)
+        with torch.no_grad():
+            past = model(ids, use_cache=True).past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+        size = sum(t.numel() * t.element_size() for layer in past for t in layer)
+        return ids, past, size
+
+    def get(self, model, tokenizer, key, prefix):
+        """Return (prefix_ids, legacy_past) for `prefix`, computing it on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+
+        self.misses += 1
+        ids, past, size = self._compute(model, tokenizer, prefix)
+        with self._lock:
+            if size <= self.max_bytes:
+                self._entries[key] = (ids, past, size)
+                self._bytes += size
+                # Evict the least recently used pairs until we fit again
+                while self._bytes > self.max_bytes:
+                    _, (_, _, old_size) = self._entries.popitem(last=False)
+                    self._bytes -= old_size
+        return ids, past
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+def reuse_prefix(inputs, prefix_ids, past):
+    """Past-key-values covering the leading columns of a left-padded batch of full prompts.
+
+    The prompts are tokenized whole, exactly as without the cache, and the cached KV
+    is only used for the leading ids every row shares with `prefix_ids`: tokenizing
+    the prefix on its own can merge differently at the boundary with the body. Each
+    row keeps its padding to the left of the prefix, where the attention mask hides
+    it, so positions derived from the mask match the ones the prefix was computed at.
+    Returns None when no row can reuse anything.
+    """
+    input_ids = inputs.input_ids
+    pads = (inputs.attention_mask == 0).sum(dim=1).tolist()
+    prefix = prefix_ids[0]
+
+    usable = prefix.shape[0]
+    for row, pad in zip(input_ids, pads):
+        tokens = row[pad:pad + usable]
+        usable = int((tokens == prefix[:tokens.shape[0]]).long().cumprod(0).sum())
+        if usable == 0:
+            return None
+
+    # At least one column must be left for generate to prefill
+    length = min(min(pads) + usable, input_ids.shape[1] - 1)
+    layers = []
+    for key, value in past:
+        shape = (len(pads), key.shape[1], length, key.shape[3])
+        batch_key, batch_value = key.new_zeros(shape), value.new_zeros(shape)
+        for i, pad in enumerate(pads):
+            # Columns [pad, length) of this row hold the first length - pad prefix tokens
+            count = length - pad
+            if count > 0:
+                batch_key[i, :, pad:length] = key[0, :, :count]
+                batch_value[i, :, pad:length] = value[0, :, :count]
+        layers.append((batch_key, batch_value))
+    # generate extends the cache in place, so every call gets its own copy
+    return DynamicCache.from_legacy_cache(tuple(layers))
@@ -0,0 +1,221 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from engine import CancelToken, TranslationCancelled
+from metrics import REGISTRY
+
+
+class ClientRegistry:
+    """Latest request (CancelToken) of each client, so a newer one can supersede it"""
+
+    def __init__(self):
+        # client_id -> [latest CancelToken, unfinished work using it]
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def supersede(self, client_id, cancel_token):
+        """Make `cancel_token` the current request of `client_id`, cancelling the previous one.
+
+        Each call must be paired with a `release` once the work it covers is done.
+        """
+        with self._lock:
+            entry = self._clients.get(client_id)
+            if entry is not None and entry[0] is cancel_token:
+                entry[1] += 1
+                return
+            self._clients[client_id] = [cancel_token, 1]
+        if entry is not None:
+            entry[0].cancel()
+
+    def release(self, client_id, cancel_token):
+        with self._lock:
+            entry = self._clients.get(client_id)
+            if entry is not None and entry[0] is cancel_token:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._clients[client_id]
+
+    def cancel(self, client_id):
+        with self._lock:
+            entry = self._clients.get(client_id)
+        if entry is not None:
+            entry[0].cancel()
+
+    def track(self, client_id, future):
+        """Supersede with `future.cancel_token` and release it once the future is done"""
+        self.supersede(client_id, future.cancel_token)
+        future.add_done_callback(lambda _: self.release(client_id, future.cancel_token))
+
+
+class BatchScheduler:
+    """Queue translation requests and run them through the engine in dynamic batches.
+
+    A single worker thread owns the model. It waits for the first request, then keeps
+    collecting until `max_batch_size` requests are queued or `max_wait` seconds have
+    passed, runs one `translate_batch` for the group and resolves each caller's future.
+
+    Every future carries a `cancel_token`. Cancelling it drops the job if it is still
+    queued and stops its generation at the next token if it is running; the future
+    then raises TranslationCancelled. Requests submitted with a `client_id` supersede
+    that client's previous, still unfinished request.
+    """
+
+    def __init__(self, engine, max_batch_size=8, max_wait=0.05, metrics=None):
+        self.engine = engine
+        self.metrics = metrics or REGISTRY
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._running = False
+        self.clients = ClientRegistry()
+        # Utilization accounting for stats()
+        self.created = time.monotonic()
+        self.busy_seconds = 0.0
+        self.in_flight = 0
+        self.completed = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="batch-scheduler")
+        self._worker.daemon = True
+        self._worker.start()
+
+    def stop(self):
+        """Stop the worker after the batch in progress; pending requests are cancelled"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)  # Wake the worker up
+        self._worker.join()
+        self._worker = None
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].cancel()
+
+    def submit(self, input_content, source_lang, target_lang, cancel_token=None, client_id=None):
+        """Queue a request and return a Future resolving to the translated text.
+
+        Several submits sharing one `cancel_token` (e.g. the segments of a document)
+        count as one request of `client_id`, and are cancelled together.
+        """
+        if not self._running:
+            raise RuntimeError("Scheduler is not running")
+        future = Future()
+        future.enqueued = time.monotonic()
+        future.cancel_token = cancel_token or CancelToken()
+        if client_id is not None:
+            self.clients.track(client_id, future)
+        self._queue.put(((input_content, source_lang, target_lang), future))
+        return future
+
+    def translate(self, input_content, source_lang, target_lang, timeout=None, cancel_token=None, client_id=None):
+        """Blocking convenience wrapper around `submit`"""
+        future = self.submit(input_content, source_lang, target_lang, cancel_token, client_id)
+        return future.result(timeout=timeout)
+
+    def translate_stream(self, input_content, source_lang, target_lang, cancel_token=None):
+        """Stream one translation; it bypasses the batch queue and runs on the engine directly"""
+        return self.engine.translate_stream(input_content, source_lang, target_lang, cancel_token=cancel_token)
+
+    def supersede(self, client_id, cancel_token):
+        self.clients.supersede(client_id, cancel_token)
+
+    def release(self, client_id, cancel_token):
+        self.clients.release(client_id, cancel_token)
+
+    def cancel(self, client_id=None):
+        """Cancel the current request of `client_id`, or every queued and running request"""
+        if client_id is not None:
+            self.clients.cancel(client_id)
+            return
+        with self._queue.mutex:
+            items = [item for item in self._queue.queue if item is not None]
+        for _, future in items:
+            future.cancel_token.cancel()
+        self.engine.cancel()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def load(self):
+        """Queued plus running requests, used to pick the least busy replica"""
+        return self.pending() + self.in_flight
+
+    def stats(self):
+        """Queue depth and utilization of this scheduler's engine"""
+        elapsed = time.monotonic() - self.created
+        return {
+            "device": self.engine.device,
+            "queue_depth": self.pending(),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "busy_seconds": self.busy_seconds,
+            "utilization": self.busy_seconds / elapsed if elapsed > 0 else 0.0,
+            "weights_bytes": self.engine.memory_by_device,
+        }
+
+    def _collect_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Let the outer loop see the stop signal
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect_batch()
+            for _, future in batch:
+                if future.cancel_token.cancelled:
+                    future.cancel()
+            # Drop requests whose caller has already given up
+            batch = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            for _, future in batch:
+                self.metrics.observe("translator_queue_wait_seconds", started - future.enqueued)
+
+            self.in_flight = len(batch)
+            try:
+                results = self.engine.translate_batch(
+                    [job for job, _ in batch], cancel_tokens=[future.cancel_token for _, future in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self.in_flight = 0
+                self.busy_seconds += time.monotonic() - started
+                self.completed += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if result is None:
+                    future.set_exception(TranslationCancelled())
+                else:
+                    future.set_result(result)
@@ -0,0 +1,184 @@
+"""Split documents into sentence-sized segments and put translations back together.
+
+Short segments keep prompts (and the KV cache) small, so a long document costs
+roughly linear time instead of quadratic attention over the whole text.
+"""
+import difflib
+import re
+
+# Scripts written without spaces between sentences
+CJK_CODES = {"zh", "ja"}
+
+# Longest segment we try to keep; neighbouring short sentences are merged up to this
+DEFAULT_MAX_SEGMENT_CHARS = 400
+
+# Paragraph breaks: one or more newlines, with any blank-line whitespace between them
+_PARAGRAPH_BREAK = re.compile(r"\n(?:[ \t]*\n)*")
+
+# Sentence ends after CJK terminators (no following space needed) ...
+_CJK_SENTENCE_END = re.compile(r"(?<=[。！？；…!?])[”’」』）)\"']*")
+# ... or after Latin terminators followed by whitespace
+_LATIN_SENTENCE_END = re.compile(r"(?<=[.!?;…])[\"'”’)\]]*(?=\s)")
+_CLAUSE_BREAK = re.compile(r"(?<=[，、,：:])")
+# The last whitespace run in the searched window, where a word-safe wrap can go
+_LAST_SPACE = re.compile(r"\s+(?=\S*$)")
+
+
+def _split_at(pattern, text):
+    """Split after every match of `pattern`, keeping the text intact when rejoined"""
+    pieces = []
+    last = 0
+    for match in pattern.finditer(text):
+        end = match.end()
+        if end > last:
+            pieces.append(text[last:end])
+            last = end
+    if last < len(text):
+        pieces.append(text[last:])
+    return pieces
+
+
+def split_sentences(paragraph, lang_code):
+    """Split a paragraph into sentences, handling CJK and Latin punctuation"""
+    if lang_code in CJK_CODES:
+        pieces = _split_at(_CJK_SENTENCE_END, paragraph)
+    else:
+        # Latin punctuation first, then catch CJK terminators in mixed text
+        pieces = []
+        for piece in _split_at(_LATIN_SENTENCE_END, paragraph):
+            pieces.extend(_split_at(_CJK_SENTENCE_END, piece))
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+def _split_long(sentence, max_chars, lang_code):
+    """Break an over-long sentence at clause punctuation, then wrap as a last resort.
+
+    Scripts with spaces wrap at the last space that fits, so no word is cut in half;
+    CJK text, or a run without any space, is hard-wrapped at `max_chars`.
+    """
+    if len(sentence) <= max_chars:
+        return [sentence]
+    parts = []
+    for clause in _merge(_split_at(_CLAUSE_BREAK, sentence), max_chars, ""):
+        while len(clause) > max_chars:
+            cut = max_chars
+            if lang_code not in CJK_CODES:
+                space = _LAST_SPACE.search(clause, 0, max_chars + 1)
+                if space and space.start() > 0:
+                    cut = space.start()
+            parts.append(clause[:cut].rstrip())
+            clause = clause[cut:].lstrip()
+        if clause:
+            parts.append(clause)
+    return parts
+
+
+def _merge(sentences, max_chars, joiner):
+    """Greedily merge consecutive short sentences up to `max_chars`"""
+    merged = []
+    for sentence in sentences:
+        if merged and len(merged[-1]) + len(joiner) + len(sentence) <= max_chars:
+            merged[-1] = merged[-1] + joiner + sentence
+        else:
+            merged.append(sentence)
+    return merged
+
+
+def segment_document(text, lang_code, max_chars=DEFAULT_MAX_SEGMENT_CHARS, merge=True):
+    """Return (segments, layout) for `text`.
+
+    `segments` is the flat list of strings to translate. `layout` records, per
+    paragraph, how many segments it holds and the separator that followed it, so
+    `reassemble` can restore the original paragraph structure.
+
+    With `merge=False` every sentence is its own segment. Incremental translation
+    needs that: merged segments shift when an edit moves a sentence across a merge
+    boundary, which would invalidate every later segment of the paragraph.
+    """
+    joiner = "" if lang_code in CJK_CODES else " "
+    segments = []
+    layout = []
+
+    pieces = _split_at(_PARAGRAPH_BREAK, text)
+    for piece in pieces:
+        match = _PARAGRAPH_BREAK.search(piece)
+        body = piece[:match.start()] if match else piece
+        separator = piece[match.start():] if match else ""
+
+        sentences = []
+        for sentence in split_sentences(body, lang_code):
+            sentences.extend(_split_long(sentence, max_chars, lang_code))
+        paragraph_segments = _merge(sentences, max_chars, joiner) if merge else sentences
+
+        segments.extend(paragraph_segments)
+        layout.append((len(paragraph_segments), separator))
+    return segments, layout
+
+
+def reassemble(translations, layout, target_code):
+    """Join translated segments back into paragraphs using the recorded layout"""
+    joiner = "" if target_code in CJK_CODES else " "
+    parts = []
+    index = 0
+    for count, separator in layout:
+        paragraph = translations[index:index + count]
+        index += count
+        parts.append(joiner.join(segment.strip() for segment in paragraph))
+        parts.append(separator)
+    return "".join(parts)
+
+
+def segment_leads(layout, target_code):
+    """The text `reassemble` puts in front of each segment, for output built up segment by segment"""
+    joiner = "" if target_code in CJK_CODES else " "
+    leads = []
+    pending = ""
+    for count, separator in layout:
+        for i in range(count):
+            leads.append(pending if i == 0 else joiner)
+            pending = ""
+        pending += separator
+    return leads
+
+
+def reuse_translations(old_segments, old_translations, new_segments):
+    """Map each new segment to the translation of an identical old segment, or None.
+
+    Segments are aligned with a sequence diff, so inserting or deleting a sentence
+    doesn't invalidate the ones after it; only added or edited segments come back None.
+    Pass sentence-level segments (`segment_document(..., merge=False)`) so an edit
+    only invalidates the sentence it touches.
+    """
+    reused = [None] * len(new_segments)
+    matcher = difflib.SequenceMatcher(None, old_segments, new_segments, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            reused[new_start:new_end] = old_translations[old_start:old_end]
+    return reused
+
+
+class IncrementalDocument:
+    """Segments and translations of the last translated document.
+
+    Re-translating an edited document only needs the segments `reuse` returns None
+    for; the rest are reused from the previous run. Changing the language pair starts over.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.pair = None
+        self.segments = []
+        self.translations = []
+
+    def reuse(self, segments, source_code, target_code):
+        """Translations reusable for `segments` (None where the segment must be translated)"""
+        if self.pair != (source_code, target_code):
+            return [None] * len(segments)
+        return reuse_translations(self.segments, self.translations, segments)
+
+    def update(self, segments, translations, source_code, target_code):
+        self.pair = (source_code, target_code)
+        self.segments = list(segments)
+        self.translations = list(translations)
@@ -0,0 +1,540 @@
+"""Headless HTTP/JSON translation server.
+
+Loads the model once and serves every client from that single resident copy:
+
+    python server.py --device cuda:0 --port 8080
+    python server.py --devices cuda:0 cuda:1          # one replica per GPU, load-balanced
+    python server.py --devices cuda:0 cuda:1 --shard  # one model split across both GPUs
+    python server.py --cpu-replicas 4                 # four CPU processes with pinned threads
+
+Endpoints:
+    POST /translate         {"text": "...", "source": "zh", "target": "en"}
+    POST /translate/batch   {"texts": ["...", "..."], "source": "zh", "target": "en"}
+    POST /translate/stream  same body as /translate; answers with NDJSON chunks
+    GET  /health
+    GET  /metrics           Prometheus text format
+
+With --idle-timeout, an in-process model is offloaded to CPU RAM (or freed, with
+--idle-action release) after that many idle seconds and restored by the next
+request; /health and /metrics report process and GPU memory.
+
+Texts longer than one segment are split into sentences, batched and put back
+together, so long documents aren't cut off at the generation limit.
+
+Requests beyond --max-queue get 429 with Retry-After (413 for a batch that could
+never fit); requests that take longer than --timeout seconds get 504 and their
+generation is cancelled. Bodies may carry a
+"client_id": a newer request with the same id cancels the older one, which gets 409.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+
+from cache import TranslationCache
+from engine import CPU_PROFILES, DECODING_MODES, LANGUAGES, CancelToken, TranslationCancelled, TranslationEngine, resolve_language
+from lifecycle import IDLE_ACTIONS, IdleMonitor, memory_report
+from metrics import configure_json_log
+from pool import ReplicaPool, cpu_process_pool, device_pool
+from scheduler import BatchScheduler
+from segmentation import reassemble, segment_document
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+ROUTES = ("/health", "/metrics", "/translate", "/translate/batch", "/translate/stream")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class TranslationServer:
+    """asyncio HTTP front end over a shared TranslationEngine and BatchScheduler.
+
+    `scheduler` may also be a ReplicaPool; `engine` is then its first replica, which
+    serves streaming requests.
+    """
+
+    def __init__(self, engine, scheduler, max_queue=64, timeout=300.0):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.started = time.time()
+        self.requests_total = {}
+        self.rejected_total = 0
+        self.timeouts_total = 0
+        self.superseded_total = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    @property
+    def engines(self):
+        return getattr(self.scheduler, "engines", [self.engine])
+
+    def memory(self):
+        devices = {device for engine in self.engines for device in engine.memory_by_device}
+        return memory_report(devices)
+
+    def replica_stats(self):
+        if isinstance(self.scheduler, ReplicaPool):
+            return self.scheduler.stats()
+        return [self.scheduler.stats()]
+
+    # HTTP plumbing
+
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        status = 500
+        path = "?"
+        try:
+            method, path, body = await self._read_request(reader)
+            status = await self._dispatch(method, path, body, writer)
+        except HTTPError as e:
+            status = e.status
+            headers = {"Retry-After": "1"} if e.status == 429 else None
+            await self._send_json(writer, e.status, {"error": e.message}, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await self._send_json(writer, 500, {"error": str(e)})
+        finally:
+            key = (path if path in ROUTES else "other", status)
+            self.requests_total[key] = self.requests_total.get(key, 0) + 1
+            self.latency_sum += time.perf_counter() - start
+            self.latency_count += 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise ConnectionError("Empty request")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], body
+
+    async def _send(self, writer, status, body, content_type, headers=None):
+        lines = [
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await self._send(writer, status, body, "application/json; charset=utf-8", headers)
+
+    # Routing
+
+    async def _dispatch(self, method, path, body, writer):
+        routes = {
+            "/health": ("GET", self._health),
+            "/metrics": ("GET", self._metrics),
+            "/translate": ("POST", self._translate),
+            "/translate/batch": ("POST", self._translate_batch),
+            "/translate/stream": ("POST", self._translate_stream),
+        }
+        if path not in routes:
+            raise HTTPError(404, f"No route for {path}")
+        expected, handler = routes[path]
+        if method != expected:
+            raise HTTPError(405, f"{path} expects {expected}")
+        return await handler(body, writer)
+
+    def _parse(self, body):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        try:
+            source = resolve_language(payload.get("source", "zh"))
+            target = resolve_language(payload.get("target", "en"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        if source == target:
+            raise HTTPError(400, "Source and target languages cannot be the same.")
+        return payload, source, target
+
+    def _admit(self, count=1):
+        """Reserve queue slots or reject with 429 when the server is saturated"""
+        # An offloaded or released model still counts: the request will restore it
+        if not self.engine.ready:
+            raise HTTPError(503, "Model is not loaded")
+        if self.in_flight + count > self.max_queue:
+            self.rejected_total += 1
+            raise HTTPError(429, "Translation queue is full, retry later")
+        self.in_flight += count
+
+    async def _await_all(self, futures):
+        wrapped = [asyncio.wrap_future(future) for future in futures]
+        try:
+            return await asyncio.wait_for(asyncio.gather(*wrapped), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            for future in futures:
+                # Queued jobs are dropped, running ones stop at their next token
+                future.cancel_token.cancel()
+                future.cancel()
+            self.timeouts_total += 1
+            raise HTTPError(504, f"Translation did not finish within {self.timeout:.0f}s")
+        except TranslationCancelled:
+            self.superseded_total += 1
+            raise HTTPError(409, "Superseded by a newer request from the same client")
+        except (asyncio.CancelledError, concurrent.futures.CancelledError):
+            # Superseded while still queued: the scheduler cancelled the future itself.
+            # Anything else is this handler being cancelled and must propagate.
+            if not any(future.cancelled() for future in futures):
+                raise
+            self.superseded_total += 1
+            raise HTTPError(409, "Superseded by a newer request from the same client")
+
+    def _submit(self, texts, source, target, client_id):
+        """Queue the segments of every text under one cancel token.
+
+        Returns the futures and, per text, its segment count and layout for `_reassemble`.
+        """
+        token = CancelToken()
+        futures = []
+        layouts = []
+        for text in texts:
+            segments, layout = segment_document(text, source["code"])
+            futures.extend(self.scheduler.submit(segment, source, target, token, client_id) for segment in segments)
+            layouts.append((len(segments), layout))
+        return futures, layouts
+
+    @staticmethod
+    def _reassemble(results, layouts, target):
+        translations = []
+        index = 0
+        for count, layout in layouts:
+            translations.append(reassemble(results[index:index + count], layout, target["code"]))
+            index += count
+        return translations
+
+    async def _translate(self, body, writer):
+        payload, source, target = self._parse(body)
+        text = payload.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "'text' must be a non-empty string")
+
+        self._admit()
+        try:
+            futures, layouts = self._submit([text], source, target, payload.get("client_id"))
+            results = await self._await_all(futures)
+        finally:
+            self.in_flight -= 1
+        translation, = self._reassemble(results, layouts, target)
+        await self._send_json(writer, 200, {"translation": translation})
+        return 200
+
+    async def _translate_batch(self, body, writer):
+        payload, source, target = self._parse(body)
+        texts = payload.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPError(400, "'texts' must be a list of strings")
+        # Retrying can never help a batch larger than the whole queue
+        if len(texts) > self.max_queue:
+            raise HTTPError(413, f"A batch may hold at most {self.max_queue} texts")
+
+        self._admit(len(texts))
+        try:
+            futures, layouts = self._submit(texts, source, target, payload.get("client_id"))
+            results = await self._await_all(futures)
+        finally:
+            self.in_flight -= len(texts)
+        await self._send_json(writer, 200, {"translations": self._reassemble(results, layouts, target)})
+        return 200
+
+    async def _translate_stream(self, body, writer):
+        payload, source, target = self._parse(body)
+        text = payload.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "'text' must be a non-empty string")
+
+        self._admit()
+        client_id = payload.get("client_id")
+        token = CancelToken()
+        if client_id is not None:
+            self.scheduler.supersede(client_id, token)
+        try:
+            loop = asyncio.get_running_loop()
+            chunks = asyncio.Queue()
+            # A replica pool starts the stream on its least busy replica
+            stream = self.scheduler.translate_stream(text, source, target, cancel_token=token)
+
+            def pump():
+                # Runs on a worker thread; hands chunks back to the event loop
+                try:
+                    for chunk in stream:
+                        loop.call_soon_threadsafe(chunks.put_nowait, {"chunk": chunk})
+                    final = {
+                        "translation": stream.result(),
+                        "time_to_first_token": stream.time_to_first_token,
+                        "tokens_per_second": stream.tokens_per_second,
+                    }
+                    loop.call_soon_threadsafe(chunks.put_nowait, final)
+                except TranslationCancelled:
+                    loop.call_soon_threadsafe(chunks.put_nowait, {"error": "Cancelled"})
+                except Exception as e:
+                    loop.call_soon_threadsafe(chunks.put_nowait, {"error": str(e)})
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+            threading.Thread(target=pump, daemon=True).start()
+
+            writer.write((
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+                "Transfer-Encoding: chunked\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode("latin-1"))
+            deadline = loop.time() + self.timeout
+            while True:
+                try:
+                    item = await asyncio.wait_for(chunks.get(), timeout=max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    self.timeouts_total += 1
+                    item = {"error": f"Translation did not finish within {self.timeout:.0f}s"}
+                    self._write_chunk(writer, item)
+                    break
+                if item is None:
+                    break
+                self._write_chunk(writer, item)
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            # Timed out or the client went away: stop generating for nobody
+            token.cancel()
+            if client_id is not None:
+                self.scheduler.release(client_id, token)
+            self.in_flight -= 1
+        return 200
+
+    def _write_chunk(self, writer, item):
+        data = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+
+    async def _health(self, body, writer):
+        status = 200 if self.engine.ready else 503
+        await self._send_json(writer, status, {
+            "status": "ok" if self.engine.ready else "loading",
+            "device": self.engine.device,
+            "cpu_profile": self.engine.cpu_profile,
+            "residency": [engine.residency for engine in self.engines],
+            "memory": self.memory(),
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "replicas": self.replica_stats(),
+            "uptime_seconds": round(time.time() - self.started, 1),
+        })
+        return status
+
+    async def _metrics(self, body, writer):
+        lines = [
+            "# TYPE translator_http_requests_total counter",
+        ]
+        for (path, status), count in sorted(self.requests_total.items()):
+            lines.append(f'translator_http_requests_total{{path="{path}",status="{status}"}} {count}')
+        lines += [
+            "# TYPE translator_rejected_total counter",
+            f"translator_rejected_total {self.rejected_total}",
+            "# TYPE translator_timeouts_total counter",
+            f"translator_timeouts_total {self.timeouts_total}",
+            "# TYPE translator_superseded_total counter",
+            f"translator_superseded_total {self.superseded_total}",
+            "# TYPE translator_request_seconds summary",
+            f"translator_request_seconds_sum {self.latency_sum:.6f}",
+            f"translator_request_seconds_count {self.latency_count}",
+            "# TYPE translator_in_flight gauge",
+            f"translator_in_flight {self.in_flight}",
+            "# TYPE translator_scheduler_queue_depth gauge",
+            f"translator_scheduler_queue_depth {self.scheduler.pending()}",
+        ]
+        if self.engine.cache is not None:
+            stats = self.engine.cache.stats()
+            lines += [
+                "# TYPE translator_cache_hits_total counter",
+                f'translator_cache_hits_total{{tier="memory"}} {stats["memory_hits"]}',
+                f'translator_cache_hits_total{{tier="disk"}} {stats["disk_hits"]}',
+                "# TYPE translator_cache_misses_total counter",
+                f"translator_cache_misses_total {stats['misses']}",
+            ]
+        generated = sum(engine.decoding_totals["generated_tokens"] for engine in self.engines)
+        forwards = sum(engine.decoding_totals["forward_passes"] for engine in self.engines)
+        lines += [
+            "# TYPE translator_generated_tokens_total counter",
+            f"translator_generated_tokens_total {generated}",
+            "# TYPE translator_forward_passes_total counter",
+            f"translator_forward_passes_total {forwards}",
+        ]
+        memory = self.memory()
+        lines += [
+            "# TYPE translator_process_resident_bytes gauge",
+            f"translator_process_resident_bytes {memory['rss_bytes'] or 0}",
+            "# TYPE translator_process_peak_resident_bytes gauge",
+            f"translator_process_peak_resident_bytes {memory['peak_rss_bytes'] or 0}",
+        ]
+        for name, key in (("allocated", "allocated_bytes"), ("reserved", "reserved_bytes"), ("peak", "peak_bytes")):
+            lines.append(f"# TYPE translator_device_{name}_bytes gauge")
+            for device, stats in memory["devices"].items():
+                lines.append(f'translator_device_{name}_bytes{{device="{device}"}} {stats[key]}')
+        lines.append("# TYPE translator_model_resident gauge")
+        for i, engine in enumerate(self.engines):
+            lines.append(f'translator_model_resident{{replica="{i}"}} {int(engine.residency == "resident")}')
+        replicas = self.replica_stats()
+        for name, kind in (("queue_depth", "gauge"), ("in_flight", "gauge"), ("utilization", "gauge"), ("completed", "counter")):
+            lines.append(f"# TYPE translator_replica_{name} {kind}")
+            for i, stats in enumerate(replicas):
+                lines.append(f'translator_replica_{name}{{replica="{i}",device="{stats["device"]}"}} {stats[name]}')
+        lines.append("# TYPE translator_replica_weights_bytes gauge")
+        for i, stats in enumerate(replicas):
+            for device, size in sorted(stats["weights_bytes"].items()):
+                lines.append(f'translator_replica_weights_bytes{{replica="{i}",device="{device}"}} {size}')
+        if self.engine.prefix_cache is not None:
+            stats = self.engine.prefix_cache.stats()
+            lines += [
+                "# TYPE translator_prefix_cache_hits_total counter",
+                f"translator_prefix_cache_hits_total {stats['hits']}",
+                "# TYPE translator_prefix_cache_bytes gauge",
+                f"translator_prefix_cache_bytes {stats['bytes']}",
+            ]
+        # Engine-level counters, histograms and span timings
+        body = ("\n".join(lines) + "\n" + self.engine.metrics.render_prometheus()).encode("utf-8")
+        await self._send(writer, 200, body, "text/plain; version=0.0.4")
+        return 200
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline-Translator HTTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--device", default="cpu", help="cpu or cuda:N")
+    parser.add_argument("--devices", nargs="+", default=None, help="Load one replica per device, e.g. cuda:0 cuda:1")
+    parser.add_argument("--shard", action="store_true", help="Split one model across --devices instead of replicating it")
+    parser.add_argument("--cpu-replicas", type=int, default=0, help="Run N CPU replicas in separate processes")
+    parser.add_argument("--threads-per-replica", type=int, default=None, help="Defaults to the cores split evenly")
+    parser.add_argument("--cpu-profile", default="bf16", choices=list(CPU_PROFILES))
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=0.05, help="Seconds to wait for a batch to fill")
+    parser.add_argument("--max-queue", type=int, default=64, help="Requests admitted before answering 429")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--deterministic", action="store_true", help="Greedy decoding with translation memory")
+    parser.add_argument("--decoding", default="standard", choices=list(DECODING_MODES))
+    parser.add_argument("--draft-model-dir", default=None, help="Small model for --decoding assisted")
+    parser.add_argument("--idle-timeout", type=float, default=0, help="Seconds without requests before --idle-action (0 = never)")
+    parser.add_argument("--idle-action", default="offload", choices=[action for action in IDLE_ACTIONS if action != "keep"],
+                        help="offload: move weights to CPU RAM; release: free them and reload on demand")
+    parser.add_argument("--prefix-cache", action="store_true", help="Reuse the KV cache of each language pair's prompt prefix")
+    parser.add_argument("--cleanup-rules", default=None, help="JSON file of per-pair output cleanup rules")
+    parser.add_argument("--metrics-log", default=None, help="Append per-request traces to this JSONL file")
+    parser.add_argument("--profile-requests", type=int, default=0, help="Capture torch profiler traces for the first N generate calls")
+    args = parser.parse_args(argv)
+
+    if args.metrics_log:
+        configure_json_log(args.metrics_log)
+
+    log = lambda message: print(message, flush=True)
+    engine_kwargs = dict(
+        deterministic=args.deterministic, decoding_mode=args.decoding, draft_model_dir=args.draft_model_dir,
+        use_prefix_cache=args.prefix_cache, cleanup_rules=args.cleanup_rules
+    )
+    scheduler_kwargs = dict(max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+    load_kwargs = dict(cpu_profile=args.cpu_profile)
+
+    if args.cpu_replicas:
+        print(f"Starting {args.cpu_replicas} CPU replicas...", flush=True)
+        scheduler = cpu_process_pool(
+            args.cpu_replicas, args.model_dir, threads_per_replica=args.threads_per_replica,
+            engine_kwargs=engine_kwargs, load_kwargs=load_kwargs, scheduler_kwargs=scheduler_kwargs, progress=log
+        )
+    elif args.devices and not args.shard:
+        print(f"Loading one replica per device: {', '.join(args.devices)}...", flush=True)
+        # Replicas share one translation memory
+        scheduler = device_pool(
+            args.devices, args.model_dir, engine_kwargs=dict(engine_kwargs, cache=TranslationCache()),
+            load_kwargs=load_kwargs, scheduler_kwargs=scheduler_kwargs, progress=log
+        )
+    else:
+        engine = TranslationEngine(args.model_dir, cache=TranslationCache(), **engine_kwargs)
+        if args.devices:
+            print(f"Loading model split across {', '.join(args.devices)}...", flush=True)
+            engine.load(args.devices[0], progress=log, shard_devices=args.devices, **load_kwargs)
+        else:
+            print(f"Loading model to {args.device}...", flush=True)
+            engine.load(args.device, progress=log, **load_kwargs)
+        scheduler = BatchScheduler(engine, **scheduler_kwargs)
+    engine = scheduler.engine
+    if args.profile_requests:
+        engine.metrics.profile_next(args.profile_requests)
+    scheduler.start()
+    monitors = []
+    if args.idle_timeout:
+        # Process replicas keep their weights in the page cache already
+        for replica in getattr(scheduler, "engines", [engine]):
+            if hasattr(replica, "offload"):
+                monitor = IdleMonitor(
+                    replica, timeout=args.idle_timeout, action=args.idle_action,
+                    on_change=lambda residency, device=replica.device: log(f"[{device}] idle, model {residency}")
+                )
+                monitor.start()
+                monitors.append(monitor)
+
+    server = TranslationServer(engine, scheduler, max_queue=args.max_queue, timeout=args.timeout)
+
+    async def serve():
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        print(f"Serving {len(LANGUAGES)} languages on http://{args.host}:{args.port}", flush=True)
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for monitor in monitors:
+            monitor.stop()
+        scheduler.stop()
+        if isinstance(scheduler, ReplicaPool):
+            scheduler.unload()
+
+
+if __name__ == "__main__":
+    main()
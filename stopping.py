@@ -0,0 +1,114 @@
+"""Stopping criteria that end generation as soon as the translation is complete.
+
+This module imports torch/transformers at module level; the engine imports it lazily
+at translation time, once the model is already loaded.
+"""
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from engine import LANGUAGES
+from postprocess import STRONG_EXPLANATION_MARKERS, compile_alternation
+
+# Upper bound kept from the original generation settings
+MAX_NEW_TOKENS = 1536
+
+# Output tokens per input token when translating out of / into these scripts.
+# CJK text packs more meaning per token, so Latin output grows relative to it.
+_DENSE_SCRIPT_CODES = {"zh", "ja", "ko"}
+_DENSE_TO_LATIN_RATIO = 2.5
+_LATIN_TO_DENSE_RATIO = 1.5
+_DEFAULT_RATIO = 2.0
+_BUDGET_SLACK = 32
+_MIN_BUDGET = 64
+
+
+def prompt_label_stop_strings():
+    """A new prompt label line means the model started another turn"""
+    labels = [entry["name"] for entry in LANGUAGES.values()] + ["英文"]
+    stops = []
+    for label in labels:
+        stops.append(f"\n{label}:")
+        stops.append(f"\n{label}：")
+    return stops
+
+
+STOP_STRINGS = prompt_label_stop_strings() + list(STRONG_EXPLANATION_MARKERS)
+_STOP_PATTERN = compile_alternation(STOP_STRINGS)
+
+
+def truncate_at_stop_strings(text, stop_strings=STOP_STRINGS):
+    """Cut `text` at the earliest stop string, if any"""
+    pattern = _STOP_PATTERN if stop_strings is STOP_STRINGS else compile_alternation(stop_strings)
+    match = pattern.search(text) if pattern else None
+    return text[:match.start()] if match else text
+
+
+def length_budget(input_tokens, source_lang, target_lang):
+    """Max new tokens for a translation of `input_tokens` prompt tokens"""
+    source_dense = source_lang["code"] in _DENSE_SCRIPT_CODES
+    target_dense = target_lang["code"] in _DENSE_SCRIPT_CODES
+    if source_dense and not target_dense:
+        ratio = _DENSE_TO_LATIN_RATIO
+    elif target_dense and not source_dense:
+        ratio = _LATIN_TO_DENSE_RATIO
+    else:
+        ratio = _DEFAULT_RATIO
+    budget = int(input_tokens * ratio) + _BUDGET_SLACK
+    return min(max(budget, _MIN_BUDGET), MAX_NEW_TOKENS)
+
+
+class StopOnStrings(StoppingCriteria):
+    """Stop a row once its recent output contains any of `stop_strings`"""
+
+    def __init__(self, tokenizer, stop_strings, input_length, lookback_tokens=16):
+        self.tokenizer = tokenizer
+        self.stop_strings = stop_strings
+        self.input_length = input_length
+        # Only the tail is decoded each step; a stop string seen earlier already fired
+        self.lookback_tokens = lookback_tokens
+
+    def __call__(self, input_ids, scores, **kwargs):
+        start = max(self.input_length, input_ids.shape[1] - self.lookback_tokens)
+        tails = self.tokenizer.batch_decode(input_ids[:, start:], skip_special_tokens=True)
+        done = [any(stop in tail for stop in self.stop_strings) for tail in tails]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class LengthBudget(StoppingCriteria):
+    """Stop each row once it has produced its own token budget"""
+
+    def __init__(self, budgets, input_length):
+        self.budgets = torch.tensor(budgets)
+        self.input_length = input_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.input_length
+        return (generated >= self.budgets).to(input_ids.device)
+
+
+class StopOnCancel(StoppingCriteria):
+    """Stop a row at the next step once its CancelToken is set"""
+
+    def __init__(self, cancel_tokens):
+        self.cancel_tokens = cancel_tokens
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = [token is not None and token.cancelled for token in self.cancel_tokens]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def build_stopping_criteria(tokenizer, inputs, jobs, cancel_tokens=None):
+    """Return (stopping_criteria, max_new_tokens) for a left-padded batch of resolved jobs"""
+    input_length = inputs.input_ids.shape[1]
+    prompt_tokens = inputs.attention_mask.sum(dim=1).tolist()
+    budgets = [
+        length_budget(tokens, source, target)
+        for tokens, (_, source, target) in zip(prompt_tokens, jobs)
+    ]
+    criteria = StoppingCriteriaList([
+        StopOnStrings(tokenizer, STOP_STRINGS, input_length),
+        LengthBudget(budgets, input_length),
+    ])
+    if cancel_tokens and any(token is not None for token in cancel_tokens):
+        criteria.append(StopOnCancel(cancel_tokens))
+    return criteria, max(budgets)
@@ -0,0 +1,106 @@
+import csv
+import json
+
+import pytest
+
+from batch_translate import translate_file
+
+
+class StubEngine:
+    """Upper-cases its inputs; raises once `fail_after` batches have been translated"""
+
+    def __init__(self, fail_after=None):
+        self.decoding_totals = {"generated_tokens": 0, "forward_passes": 0}
+        self.batches = []
+        self.documents = []
+        self.fail_after = fail_after
+
+    def translate_batch(self, jobs):
+        if self.fail_after is not None and len(self.batches) >= self.fail_after:
+            raise KeyboardInterrupt
+        self.batches.append([text for text, _, _ in jobs])
+        self.decoding_totals["generated_tokens"] += len(jobs)
+        return [text.upper() for text, _, _ in jobs]
+
+    def translate_document(self, text, source_lang, target_lang, batch_size=8):
+        self.documents.append(text)
+        return text.upper()
+
+
+def run(engine, input_path, output_path, **kwargs):
+    kwargs.setdefault("batch_size", 2)
+    return translate_file(engine, str(input_path), str(output_path), "zh", "en", log=lambda message: None, **kwargs)
+
+
+def test_txt_round_trip_keeps_blank_lines(tmp_path):
+    source = tmp_path / "in.txt"
+    source.write_text("one\n\ntwo\nthree\n", encoding="utf-8")
+    output = tmp_path / "out.txt"
+    assert run(StubEngine(), source, output) == 4
+    assert output.read_text(encoding="utf-8") == "ONE\n\nTWO\nTHREE\n"
+    assert not (tmp_path / "out.txt.ckpt").exists()
+
+
+def test_jsonl_round_trip_adds_output_field(tmp_path):
+    source = tmp_path / "in.jsonl"
+    source.write_text('{"id": 1, "text": "a"}\n\n{"id": 2, "text": "b"}\n', encoding="utf-8")
+    output = tmp_path / "out.jsonl"
+    run(StubEngine(), source, output, output_field="en")
+    rows = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert rows == [{"id": 1, "text": "a", "en": "A"}, {"id": 2, "text": "b", "en": "B"}]
+
+
+def test_csv_round_trip_adds_column(tmp_path):
+    source = tmp_path / "in.csv"
+    source.write_text("id,body\n1,x\n2,y\n3,z\n", encoding="utf-8")
+    output = tmp_path / "out.csv"
+    run(StubEngine(), source, output, field="body")
+    with open(output, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["id"], row["translation"]) for row in rows] == [("1", "X"), ("2", "Y"), ("3", "Z")]
+
+
+def test_multi_segment_records_go_through_translate_document(tmp_path):
+    source = tmp_path / "in.txt"
+    long_line = "A fairly ordinary sentence. " * 200
+    source.write_text(f"short\n{long_line}\n", encoding="utf-8")
+    engine = StubEngine()
+    run(engine, source, tmp_path / "out.txt")
+    assert engine.batches == [["short"]]
+    assert engine.documents == [long_line]
+
+
+def test_resume_truncates_partial_output(tmp_path):
+    source = tmp_path / "in.txt"
+    source.write_text("".join(f"line {i}\n" for i in range(6)), encoding="utf-8")
+    output = tmp_path / "out.txt"
+    with pytest.raises(KeyboardInterrupt):
+        run(StubEngine(fail_after=1), source, output)
+    # Output written after the last checkpoint is dropped on resume
+    with open(output, "a", encoding="utf-8") as f:
+        f.write("HALF WRITTEN")
+
+    engine = StubEngine()
+    assert run(engine, source, output) == 6
+    assert engine.batches == [["line 2", "line 3"], ["line 4", "line 5"]]
+    assert output.read_text(encoding="utf-8") == "".join(f"LINE {i}\n" for i in range(6))
+
+
+def test_resume_refuses_checkpoint_of_another_job(tmp_path):
+    source = tmp_path / "in.txt"
+    source.write_text("a\nb\nc\n", encoding="utf-8")
+    output = tmp_path / "out.txt"
+    with pytest.raises(KeyboardInterrupt):
+        run(StubEngine(fail_after=1), source, output)
+    with pytest.raises(ValueError, match="different job"):
+        translate_file(StubEngine(), str(source), str(output), "zh", "ja", batch_size=2, log=lambda message: None)
+
+
+def test_empty_input(tmp_path):
+    source = tmp_path / "in.txt"
+    source.write_text("", encoding="utf-8")
+    output = tmp_path / "out.txt"
+    engine = StubEngine()
+    assert run(engine, source, output) == 0
+    assert output.read_text(encoding="utf-8") == ""
+    assert engine.batches == []
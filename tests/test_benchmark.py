@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import benchmark
+
+
+def test_build_corpus_is_deterministic_and_sized():
+    for size, target in benchmark.SIZES.items():
+        text = benchmark.build_corpus("en", size)
+        assert text == benchmark.build_corpus("en", size)
+        assert len(text) <= target
+
+
+def test_percentile_nearest_rank():
+    assert benchmark.percentile([], 50) is None
+    assert benchmark.percentile([3, 1, 2], 50) == 2
+    assert benchmark.percentile([1, 2, 3, 4], 99) == 4
+
+
+def test_compare_flags_regressions():
+    def run(latency):
+        case = {"pair": "zh-en", "size": "short", "latency_p50": latency, "tokens_per_sec_mean": 10.0}
+        return {"results": [{"device": "cpu", "decoding": "standard", "cpu_profile": "bf16", "cases": [case]}]}
+
+    _, regressions = benchmark.compare(run(1.5), run(1.0), threshold=0.10)
+    assert regressions == 1
+    _, regressions = benchmark.compare(run(1.05), run(1.0), threshold=0.10)
+    assert regressions == 0
+
+
+def test_tiny_benchmark_smoke(tmp_path):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    output = tmp_path / "bench.json"
+    assert benchmark.main([
+        "--tiny", "--pairs", "zh-en", "--sizes", "short", "--repeats", "1", "--output", str(output)
+    ]) == 0
+    report = json.loads(output.read_text(encoding="utf-8"))
+    setting, = report["results"]
+    case, = setting["cases"]
+    assert case["pair"] == "zh-en" and case["latency_p50"] > 0
+    assert setting["peak_rss_bytes"]
@@ -0,0 +1,65 @@
+from cache import TranslationCache, is_deterministic, make_key, normalize_segment
+from engine import TranslationEngine
+
+
+def test_normalize_segment_keeps_lines():
+    assert normalize_segment("  Hello   world \n  second\tline  ") == "Hello world\nsecond line"
+
+
+def test_make_key_ignores_spacing_but_not_params():
+    params = {"do_sample": False}
+    assert make_key("Hello  world", "en", "zh", params) == make_key(" Hello world ", "en", "zh", params)
+    assert make_key("Hello", "en", "zh", params) != make_key("Hello", "en", "ja", params)
+    assert make_key("Hello", "en", "zh", params) != make_key("Hello", "en", "zh", {"do_sample": False, "num_beams": 2})
+
+
+def test_is_deterministic():
+    assert is_deterministic({"do_sample": False})
+    assert not is_deterministic({"do_sample": True, "temperature": 0.2})
+
+
+def test_engine_key_covers_preamble_and_int8_weights():
+    chinese, english = {"code": "zh"}, {"code": "en"}
+    engine = TranslationEngine(cache=TranslationCache(path=None), deterministic=True)
+    key = engine._cache_key("Hello", chinese, english)
+    assert TranslationEngine(cache=TranslationCache(path=None), deterministic=True, preamble="Formal. ")._cache_key(
+        "Hello", chinese, english) != key
+    engine.cpu_profile = "int8"
+    int8_key = engine._cache_key("Hello", chinese, english)
+    assert int8_key != key
+    engine.cpu_profile = "int8-cached"
+    assert engine._cache_key("Hello", chinese, english) == int8_key
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    cache = TranslationCache(path=None, max_memory_bytes=10)
+    cache.put("a", "1234")    # 5 bytes
+    cache.put("b", "1234")    # 10 bytes
+    assert cache.get("a") == "1234"  # "b" is now least recently used
+    cache.put("c", "1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1234" and cache.get("c") == "1234"
+    assert cache.stats()["memory_bytes"] == 10
+
+
+def test_oversized_entries_skip_the_memory_tier():
+    cache = TranslationCache(path=None, max_memory_bytes=4)
+    cache.put("k", "far too long")
+    assert cache.get("k") is None
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "memory.db")
+    cache = TranslationCache(path=path)
+    cache.put("key", "你好，世界")
+    cache.close()
+
+    reopened = TranslationCache(path=path)
+    assert reopened.get("key") == "你好，世界"
+    assert reopened.get("key") == "你好，世界"
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+    reopened.clear()
+    assert reopened.get("key") is None
+    reopened.close()
@@ -0,0 +1,37 @@
+from segmentation import IncrementalDocument, reuse_translations, segment_document
+
+DOCUMENT = " ".join(f"Sentence number {i} has a few words." for i in range(20))
+
+
+def translate(segments):
+    return [segment.upper() for segment in segments]
+
+
+def test_merge_false_keeps_one_segment_per_sentence():
+    segments, layout = segment_document("One. Two.\n\nThree.", "en", merge=False)
+    assert segments == ["One.", "Two.", "Three."]
+    assert [count for count, _ in layout] == [2, 1]
+
+
+def test_reuse_survives_inserts_and_deletes():
+    old = ["a", "b", "c", "d"]
+    reused = reuse_translations(old, ["A", "B", "C", "D"], ["a", "x", "b", "d"])
+    assert reused == ["A", None, "B", "D"]
+
+
+def test_one_word_edit_invalidates_only_its_sentence():
+    old, _ = segment_document(DOCUMENT, "en", merge=False)
+    edited = DOCUMENT.replace("number 3 has a few", "number 3 has quite a lot of")
+    new, _ = segment_document(edited, "en", merge=False)
+    reused = reuse_translations(old, translate(old), new)
+    assert [i for i, translation in enumerate(reused) if translation is None] == [3]
+
+
+def test_incremental_document_resets_on_pair_change():
+    segments, _ = segment_document(DOCUMENT, "en", merge=False)
+    document = IncrementalDocument()
+    document.update(segments, translate(segments), "en", "zh")
+    assert document.reuse(segments, "en", "zh") == translate(segments)
+    assert document.reuse(segments, "en", "ja") == [None] * len(segments)
+    document.clear()
+    assert document.reuse(segments, "en", "zh") == [None] * len(segments)
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from engine import TranslationEngine
+from lifecycle import IdleMonitor
+
+
+class FakeEngine:
+    """Just the residency bookkeeping IdleMonitor relies on"""
+
+    def __init__(self, idle_for):
+        self.residency = "resident"
+        self.last_used = time.monotonic() - idle_for
+        self.calls = []
+
+    def offload(self, idle_for=None):
+        self.calls.append(("offload", idle_for))
+        self.residency = "offloaded"
+        return self.residency
+
+    def release(self, idle_for=None):
+        self.calls.append(("release", idle_for))
+        self.residency = "released"
+        return self.residency
+
+
+class FakeModel:
+    def __init__(self):
+        self.moves = []
+
+    def to(self, device):
+        self.moves.append(device)
+        return self
+
+
+def loaded_engine(device, idle_for):
+    """A TranslationEngine in the state `load` leaves it in, without real weights"""
+    engine = TranslationEngine()
+    engine.model = FakeModel()
+    engine.tokenizer = object()
+    engine.device = device
+    engine.residency = "resident"
+    engine._load_args = {"shard_devices": None}
+    engine.last_used = time.monotonic() - idle_for
+    return engine
+
+
+def test_unknown_action_is_rejected():
+    with pytest.raises(ValueError):
+        IdleMonitor(FakeEngine(0), action="hibernate")
+
+
+def test_monitor_waits_for_timeout():
+    changes = []
+    engine = FakeEngine(idle_for=10)
+    monitor = IdleMonitor(engine, timeout=60, on_change=changes.append)
+    assert monitor.check() is None
+    assert engine.calls == []
+
+    engine.last_used = time.monotonic() - 120
+    assert monitor.check() == "offloaded"
+    assert engine.calls == [("offload", 60)]
+    assert changes == ["offloaded"]
+    # Already offloaded: nothing more to do
+    assert monitor.check() is None
+
+
+def test_monitor_release_and_keep_actions():
+    engine = FakeEngine(idle_for=120)
+    assert IdleMonitor(engine, timeout=60, action="keep").check() is None
+    assert IdleMonitor(engine, timeout=60, action="release").check() == "released"
+    assert engine.calls == [("release", 60)]
+
+
+def test_monitor_thread_applies_action():
+    engine = FakeEngine(idle_for=0)
+    monitor = IdleMonitor(engine, timeout=0.05, interval=0.01)
+    monitor.start()
+    try:
+        deadline = time.monotonic() + 5
+        while engine.residency == "resident":
+            assert time.monotonic() < deadline
+            time.sleep(0.005)
+    finally:
+        monitor.stop()
+    assert engine.calls[0][0] == "offload"
+
+
+def test_offload_skipped_when_used_recently():
+    engine = loaded_engine("cuda:0", idle_for=5)
+    assert engine.offload(idle_for=60) == "resident"
+    assert engine.model.moves == []
+
+
+def test_offload_parks_weights_and_request_restores_them():
+    engine = loaded_engine("cuda:0", idle_for=120)
+    model = engine.model
+    assert engine.offload(idle_for=60) == "offloaded"
+    assert model.moves == ["cpu"]
+    assert engine.ready
+
+    engine.ensure_resident()
+    assert engine.residency == "resident"
+    assert model.moves == ["cpu", "cuda:0"]
+
+
+def test_cpu_model_is_released_instead_of_offloaded():
+    engine = loaded_engine("cpu", idle_for=120)
+    assert engine.offload(idle_for=60) == "released"
+    assert engine.model is None
+    assert engine.ready
+
+
+def test_release_skipped_when_used_recently():
+    engine = loaded_engine("cuda:0", idle_for=5)
+    assert engine.release(idle_for=60) == "resident"
+    assert engine.release() == "released"
+    assert engine.model is None
@@ -0,0 +1,58 @@
+import json
+import logging
+
+from metrics import Metrics, logger
+
+
+def test_counters_render_with_help_and_labels():
+    metrics = Metrics()
+    metrics.inc("translator_cache_lookups_total", 3, result="hit")
+    metrics.inc("translator_cache_lookups_total", result="miss")
+    metrics.inc("translator_cache_lookups_total", result="hit")
+    lines = metrics.render_prometheus().splitlines()
+    assert lines == [
+        "# HELP translator_cache_lookups_total Translation memory lookups by result",
+        "# TYPE translator_cache_lookups_total counter",
+        'translator_cache_lookups_total{result="hit"} 4',
+        'translator_cache_lookups_total{result="miss"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for value in (0.5, 2, 3, 100):
+        metrics.observe("translator_queue_wait_seconds", value, buckets=(1, 5, float("inf")))
+    lines = metrics.render_prometheus().splitlines()
+    assert lines[1:] == [
+        "# TYPE translator_queue_wait_seconds histogram",
+        'translator_queue_wait_seconds_bucket{le="1"} 1',
+        'translator_queue_wait_seconds_bucket{le="5"} 3',
+        'translator_queue_wait_seconds_bucket{le="+Inf"} 4',
+        "translator_queue_wait_seconds_sum 105.500000",
+        "translator_queue_wait_seconds_count 4",
+    ]
+
+
+def test_batch_trace_observes_every_request():
+    metrics = Metrics()
+    trace = metrics.trace("batch")
+    trace.add("decode", 0.25)
+    trace.finish(requests=3, tokens_in=[10, 20, 30], tokens_out=[5, 6, 7], tokens_per_second=[20.0, 24.0, 28.0])
+    text = metrics.render_prometheus()
+    assert 'translator_requests_total{kind="batch"} 3' in text
+    assert "translator_tokens_in_count 3" in text
+    assert "translator_tokens_in_sum 60.000000" in text
+    assert "translator_tokens_out_count 3" in text
+    assert "translator_tokens_per_second_count 3" in text
+    assert 'translator_span_seconds_count{span="decode"} 1' in text
+
+
+def test_stream_trace_counts_one_request(caplog):
+    metrics = Metrics()
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        metrics.trace("stream", pair="zh-en").finish(tokens_in=12, tokens_out=4, tokens_per_second=None)
+    text = metrics.render_prometheus()
+    assert 'translator_requests_total{kind="stream"} 1' in text
+    assert "translator_tokens_per_second" not in text
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["kind"] == "stream" and record["pair"] == "zh-en" and record["tokens_out"] == 4
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from engine import TranslationCancelled
+from pool import ReplicaPool
+from scheduler import BatchScheduler
+
+
+class FakeEngine:
+    """Upper-cases its inputs; `gate` holds a batch until the test releases it"""
+
+    device = "cpu"
+    memory_by_device = {}
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def cancel(self):
+        pass
+
+    def translate_batch(self, jobs, progress=None, cancel_tokens=None):
+        self.batches.append([text for text, _, _ in jobs])
+        self.gate.wait(5)
+        return [None if token and token.cancelled else text.upper() for (text, _, _), token in zip(jobs, cancel_tokens)]
+
+
+@pytest.fixture
+def engines():
+    return [FakeEngine(), FakeEngine()]
+
+
+@pytest.fixture
+def pool(engines):
+    pool = ReplicaPool([BatchScheduler(engine, max_batch_size=4, max_wait=0.01) for engine in engines])
+    pool.start()
+    yield pool
+    for engine in engines:
+        engine.gate.set()
+    pool.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_pool_needs_a_replica():
+    with pytest.raises(ValueError):
+        ReplicaPool([])
+
+
+def test_requests_go_to_the_least_loaded_replica(pool, engines):
+    busy, idle = engines
+    busy.gate.clear()
+    first = pool.submit("first", "zh", "en")
+    wait_for(lambda: busy.batches)
+    # One at a time, so the idle replica is never busier than the blocked one
+    assert [pool.translate(text, "zh", "en", timeout=5) for text in ("b", "c", "d")] == ["B", "C", "D"]
+    assert [text for batch in idle.batches for text in batch] == ["b", "c", "d"]
+    busy.gate.set()
+    assert first.result(5) == "FIRST"
+    assert busy.batches == [["first"]]
+
+
+def test_client_supersedes_across_replicas(pool, engines):
+    busy, idle = engines
+    busy.gate.clear()
+    old = pool.submit("old", "zh", "en", client_id="editor")
+    wait_for(lambda: busy.batches)
+    new = pool.submit("new", "zh", "en", client_id="editor")
+    assert new.result(5) == "NEW"
+    assert idle.batches == [["new"]]
+    busy.gate.set()
+    with pytest.raises(TranslationCancelled):
+        old.result(5)
+
+
+def test_stats_report_every_replica(pool):
+    pool.translate("a", "zh", "en", timeout=5)
+    stats = pool.stats()
+    assert len(stats) == 2
+    assert sum(replica["completed"] for replica in stats) == 1
+    assert pool.pending() == 0
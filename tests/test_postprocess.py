@@ -0,0 +1,93 @@
+import json
+import random
+
+import pytest
+
+from postprocess import FAILED_TRANSLATION, CleanupPipeline, Postprocessor, load_rules
+
+CHINESE = {"name": "中文", "code": "zh"}
+ENGLISH = {"name": "English", "code": "en"}
+
+
+@pytest.fixture
+def pipeline():
+    return Postprocessor().pipeline(CHINESE, ENGLISH)
+
+
+def test_clean_strips_labels_truncates_and_fixes(pipeline):
+    raw = "English: 中文：Hello   there, I supportfor this model. [COT] Because the user asked"
+    assert pipeline.clean(raw) == "Hello there, I support for this model."
+
+
+def test_clean_preserves_paragraphs(pipeline):
+    raw = "First paragraph line one.  \nline two.\n\n\n\nSecond paragraph."
+    assert pipeline.clean(raw) == "First paragraph line one.\nline two.\n\nSecond paragraph."
+
+
+def test_clean_unwraps_quotes_and_falls_back_when_short(pipeline):
+    assert pipeline.clean('"This sentence is long enough to keep."') == "This sentence is long enough to keep."
+    assert pipeline.clean("English: Hi") == "Hi"
+    assert pipeline.clean("English:") == FAILED_TRANSLATION
+
+
+def test_replacements_only_apply_to_their_pair():
+    processor = Postprocessor()
+    reverse = processor.pipeline(ENGLISH, CHINESE)
+    assert "supportfor" in reverse.clean("We supportfor this long enough sentence.")
+
+
+def test_rules_file_merges_by_specificity(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "*": {"markers": ["Note:"]},
+        "zh-en": {"replacements": {"inorder": "in order"}, "min_length": 0},
+    }), encoding="utf-8")
+    processor = Postprocessor.from_file(str(path))
+    assert processor.pipeline(CHINESE, ENGLISH).clean("Do it inorder. Note: why") == "Do it in order."
+    assert processor.pipeline(ENGLISH, CHINESE).clean("Do it inorder now, it is fine. Note: why") == \
+        "Do it inorder now, it is fine."
+    assert processor.fingerprint != Postprocessor().fingerprint
+
+
+def test_short_output_fallback_still_applies_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "*": {"markers": ["Note:"]},
+        "zh-en": {"replacements": {"inorder": "in order"}},
+    }), encoding="utf-8")
+    pipeline = Postprocessor.from_file(str(path)).pipeline(CHINESE, ENGLISH)
+    assert pipeline.min_length == 20
+    assert pipeline.clean("Do it inorder. Note: why") == "Do it in order."
+    assert pipeline.clean("Hello   world.  [COT] reasoning") == "Hello world."
+    assert pipeline.clean('"Hi"') == '"Hi"'
+
+
+def test_unknown_rule_keys_are_rejected(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"*": {"marker": ["typo"]}}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_rules(str(path))
+
+
+def _streamed(pipeline, text, stop_strings, rng):
+    cleaner = pipeline.stream(stop_strings)
+    pieces = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 6)
+        pieces.append(cleaner.feed(text[pos:pos + size]))
+        pos += size
+    pieces.append(cleaner.flush())
+    return "".join(pieces)
+
+
+def test_stream_cleaner_matches_clean_on_random_chunking(pipeline):
+    rng = random.Random(0)
+    stop_strings = ["\nEnglish:"]
+    reference = CleanupPipeline(pipeline.markers + stop_strings, pipeline.prefixes, pipeline.replacements)
+    alphabet = ["a", "bc", " ", "  ", "\n", "\t", "supportfor", "askingthe", "English:", "中文：", "[COT]", "\nEnglish:", "x"]
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        # clean() also unwraps quotes; the alphabet has none, and min_length=0 disables the fallback
+        expected = reference.clean(text) if reference.clean(text) != FAILED_TRANSLATION else ""
+        assert _streamed(pipeline, text, stop_strings, rng) == expected, repr(text)
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from engine import CancelToken, TranslationCancelled
+from scheduler import BatchScheduler
+
+
+class FakeEngine:
+    """Upper-cases its inputs; `gate` holds a batch until the test releases it"""
+
+    device = "cpu"
+    memory_by_device = {}
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def cancel(self):
+        pass
+
+    def translate_batch(self, jobs, progress=None, cancel_tokens=None):
+        self.batches.append([text for text, _, _ in jobs])
+        self.gate.wait(5)
+        return [None if token and token.cancelled else text.upper() for (text, _, _), token in zip(jobs, cancel_tokens)]
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine()
+
+
+@pytest.fixture
+def scheduler(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=4, max_wait=0.05)
+    scheduler.start()
+    yield scheduler
+    engine.gate.set()
+    scheduler.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_concurrent_requests_share_a_batch(scheduler, engine):
+    futures = [scheduler.submit(text, "zh", "en") for text in ("a", "b", "c")]
+    assert [future.result(5) for future in futures] == ["A", "B", "C"]
+    assert engine.batches == [["a", "b", "c"]]
+
+
+def test_batches_respect_max_batch_size(scheduler, engine):
+    futures = [scheduler.submit(str(i), "zh", "en") for i in range(6)]
+    assert [future.result(5) for future in futures] == [str(i) for i in range(6)]
+    assert max(len(batch) for batch in engine.batches) <= 4
+
+
+def test_cancel_token_drops_queued_and_running_requests(scheduler, engine):
+    engine.gate.clear()
+    token = CancelToken()
+    running = scheduler.submit("running", "zh", "en", token)
+    wait_for(lambda: engine.batches)
+    queued = scheduler.submit("queued", "zh", "en", token)
+    token.cancel()
+    engine.gate.set()
+    with pytest.raises(TranslationCancelled):
+        running.result(5)
+    with pytest.raises((TranslationCancelled, CancelledError)):
+        queued.result(5)
+
+
+def test_newer_request_supersedes_same_client(scheduler, engine):
+    engine.gate.clear()
+    old = scheduler.submit("old", "zh", "en", client_id="editor")
+    wait_for(lambda: engine.batches)
+    new = scheduler.submit("new", "zh", "en", client_id="editor")
+    other = scheduler.submit("other", "zh", "en", client_id="someone-else")
+    engine.gate.set()
+    with pytest.raises(TranslationCancelled):
+        old.result(5)
+    assert new.result(5) == "NEW"
+    assert other.result(5) == "OTHER"
+
+
+def test_stats_count_completed_requests(scheduler):
+    scheduler.translate("a", "zh", "en", timeout=5)
+    stats = scheduler.stats()
+    assert stats["completed"] == 1 and stats["queue_depth"] == 0
@@ -0,0 +1,55 @@
+from segmentation import reassemble, segment_document, segment_leads, split_sentences
+
+
+def test_split_sentences_latin_and_cjk():
+    assert split_sentences("One. Two! Three? Four", "en") == ["One.", "Two!", "Three?", "Four"]
+    assert split_sentences("你好。今天天气很好！是吗？", "zh") == ["你好。", "今天天气很好！", "是吗？"]
+    # Abbreviation-free decimals stay intact: no whitespace after the dot
+    assert split_sentences("Version 2.1 is out. Try it.", "en") == ["Version 2.1 is out.", "Try it."]
+
+
+def test_identity_translation_round_trips_paragraphs():
+    text = "First sentence. Second sentence.\n\nNew paragraph here.\n\n\nLast one."
+    segments, layout = segment_document(text, "en")
+    assert reassemble(segments, layout, "en") == text
+
+
+def test_segment_leads_rebuild_reassembled_text():
+    text = "First sentence. Second sentence.\n\nNew paragraph here.\n\n\nLast one.\n"
+    segments, layout = segment_document(text, "en", merge=False)
+    leads = segment_leads(layout, "en")
+    assert len(leads) == len(segments)
+    built = "".join(lead + segment for lead, segment in zip(leads, segments)) + layout[-1][1]
+    assert built == reassemble(segments, layout, "en")
+
+
+def test_short_sentences_merge_up_to_max_chars():
+    text = "One. Two. Three. Four."
+    segments, _ = segment_document(text, "en", max_chars=10)
+    assert segments == ["One. Two.", "Three.", "Four."]
+    assert all(len(segment) <= 10 for segment in segments)
+
+
+def test_long_sentences_are_split_without_losing_text():
+    sentence = "，".join(["这是一个很长的从句"] * 60) + "。"
+    segments, layout = segment_document(sentence, "zh", max_chars=100)
+    assert len(segments) > 1
+    assert all(len(segment) <= 100 for segment in segments)
+    assert reassemble(segments, layout, "zh") == sentence
+
+
+def test_long_latin_sentences_wrap_between_words():
+    sentence = " ".join(["translation"] * 45)
+    segments, layout = segment_document(sentence, "en", max_chars=100)
+    assert len(segments) > 1
+    assert all(len(segment) <= 100 for segment in segments)
+    assert all(set(segment.split()) == {"translation"} for segment in segments)
+    assert reassemble(segments, layout, "en") == sentence
+    # Without any space there is nothing better than a hard wrap
+    segments, _ = segment_document("x" * 250, "en", max_chars=100)
+    assert [len(segment) for segment in segments] == [100, 100, 50]
+
+
+def test_reassemble_uses_target_joiner():
+    segments, layout = segment_document("你好。再见。", "zh", max_chars=3)
+    assert reassemble(["Hello.", "Goodbye."], layout, "en") == "Hello. Goodbye."
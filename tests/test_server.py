@@ -0,0 +1,183 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from scheduler import BatchScheduler
+from server import TranslationServer
+
+
+class FakeEngine:
+    """Upper-cases its inputs; `gate` holds a batch until the test releases it"""
+
+    device = "cpu"
+    ready = True
+    memory_by_device = {}
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def cancel(self):
+        pass
+
+    def translate_batch(self, jobs, progress=None, cancel_tokens=None):
+        self.batches.append([text for text, _, _ in jobs])
+        self.gate.wait(5)
+        return [None if token and token.cancelled else text.upper() for (text, _, _), token in zip(jobs, cancel_tokens)]
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine()
+
+
+@pytest.fixture
+def scheduler(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=8, max_wait=0.01)
+    scheduler.start()
+    yield scheduler
+    engine.gate.set()
+    scheduler.stop()
+
+
+def raw_request(path, payload=None, content_length=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    length = len(body) if content_length is None else content_length
+    return f"POST {path} HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1") + body
+
+
+async def send(server, request):
+    reader = asyncio.StreamReader()
+    reader.feed_data(request)
+    reader.feed_eof()
+    writer = FakeWriter()
+    await server.handle(reader, writer)
+    head, _, body = writer.data.partition(b"\r\n\r\n")
+    status = int(head.split(b" ")[1])
+    return status, json.loads(body)
+
+
+def post(server, path, payload):
+    return asyncio.run(send(server, raw_request(path, payload)))
+
+
+def test_translate_reassembles_long_text_from_segments(scheduler, engine):
+    server = TranslationServer(engine, scheduler)
+    text = " ".join(["A fairly ordinary sentence."] * 40) + "\n\nShort paragraph."
+    status, body = post(server, "/translate", {"text": text, "source": "en", "target": "de"})
+    assert status == 200
+    assert body["translation"] == text.upper()
+    assert sum(len(batch) for batch in engine.batches) > 2
+
+
+def test_batch_keeps_texts_apart(scheduler, engine):
+    server = TranslationServer(engine, scheduler)
+    status, body = post(server, "/translate/batch", {"texts": ["One. Two.", "", "three"], "source": "en", "target": "de"})
+    assert status == 200
+    assert body["translations"] == ["ONE. TWO.", "", "THREE"]
+
+
+def test_batch_larger_than_queue_is_413(scheduler, engine):
+    server = TranslationServer(engine, scheduler, max_queue=2)
+    status, _ = post(server, "/translate/batch", {"texts": ["a", "b", "c"]})
+    assert status == 413
+    assert server.rejected_total == 0
+
+
+def test_invalid_content_length_is_400(scheduler, engine):
+    server = TranslationServer(engine, scheduler)
+    status, _ = asyncio.run(send(server, raw_request("/translate", {"text": "a"}, content_length="abc")))
+    assert status == 400
+
+
+async def wait_until(condition, timeout=5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.005)
+
+
+def test_full_queue_is_429_with_retry_after(scheduler, engine):
+    server = TranslationServer(engine, scheduler, max_queue=1)
+    engine.gate.clear()
+
+    async def scenario():
+        first = asyncio.ensure_future(send(server, raw_request("/translate", {"text": "first"})))
+        await wait_until(lambda: engine.batches)
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw_request("/translate", {"text": "second"}))
+        reader.feed_eof()
+        writer = FakeWriter()
+        await server.handle(reader, writer)
+        engine.gate.set()
+        return await first, writer.data
+
+    (status, body), rejected = asyncio.run(scenario())
+    assert status == 200 and body == {"translation": "FIRST"}
+    assert rejected.startswith(b"HTTP/1.1 429 ") and b"Retry-After: 1\r\n" in rejected
+    assert server.rejected_total == 1 and server.in_flight == 0
+
+
+def test_slow_translation_is_504_and_cancelled(scheduler, engine):
+    server = TranslationServer(engine, scheduler, timeout=0.1)
+    engine.gate.clear()
+    status, _ = post(server, "/translate", {"text": "slow"})
+    assert status == 504
+    assert server.timeouts_total == 1 and server.in_flight == 0
+    engine.gate.set()
+
+
+def test_superseded_running_request_is_409(scheduler, engine):
+    server = TranslationServer(engine, scheduler)
+    engine.gate.clear()
+
+    async def scenario():
+        old = asyncio.ensure_future(send(server, raw_request("/translate", {"text": "old", "client_id": "editor"})))
+        await wait_until(lambda: engine.batches)
+        new = asyncio.ensure_future(send(server, raw_request("/translate", {"text": "new", "client_id": "editor"})))
+        await wait_until(lambda: server.in_flight == 2)
+        engine.gate.set()
+        return await old, await new
+
+    (old_status, _), (new_status, new_body) = asyncio.run(scenario())
+    assert old_status == 409
+    assert new_status == 200 and new_body == {"translation": "NEW"}
+    assert server.superseded_total == 1
+
+
+def test_superseded_queued_request_is_409(scheduler, engine):
+    server = TranslationServer(engine, scheduler)
+    engine.gate.clear()
+
+    async def scenario():
+        blocker = asyncio.ensure_future(send(server, raw_request("/translate", {"text": "blocker"})))
+        await wait_until(lambda: engine.batches)
+        # Queued behind the blocker when the newer request from the same client arrives
+        old = asyncio.ensure_future(send(server, raw_request("/translate", {"text": "old", "client_id": "editor"})))
+        await wait_until(lambda: server.in_flight == 2)
+        new = asyncio.ensure_future(send(server, raw_request("/translate", {"text": "new", "client_id": "editor"})))
+        await wait_until(lambda: server.in_flight == 3)
+        engine.gate.set()
+        return await blocker, await old, await new
+
+    (blocker_status, _), (old_status, _), (new_status, _) = asyncio.run(scenario())
+    assert (blocker_status, old_status, new_status) == (200, 409, 200)
+    assert "old" not in [text for batch in engine.batches for text in batch]
@@ -1,15 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from transformers import AutoTokenizer, AutoModelForCausalLM, AutoConfig
-from accelerate import init_empty_weights, load_checkpoint_and_dispatch
-import os
-import torch
 import threading
+from concurrent.futures import CancelledError
 import tkinter.font as tkFont
 import time
 import traceback
 import sys
 
+from cache import TranslationCache
+from engine import CPU_PROFILES, DECODING_MODES, LANGUAGES, CancelToken, TranslationCancelled, TranslationEngine, format_bytes, list_devices, parse_device
+from lifecycle import DEFAULT_IDLE_TIMEOUT, IDLE_ACTIONS, IdleMonitor, memory_report
+from scheduler import BatchScheduler
+from segmentation import IncrementalDocument, segment_document, segment_leads, reassemble
+
+# Pause in typing before live translation kicks in
+LIVE_TRANSLATE_DELAY_MS = 800
+# Shown in place of segments that are still being re-translated
+PENDING_SEGMENT = "…"
+# Device menu entry that splits the model's layers across every GPU
+ALL_GPUS = "All GPUs (split layers)"
+# How often the memory readout refreshes
+MEMORY_REFRESH_MS = 5000
+
 def handle_exception(exc_type, exc_value, exc_traceback):
     if issubclass(exc_type, KeyboardInterrupt):
         sys.__excepthook__(exc_type, exc_value, exc_traceback)
@@ -41,42 +53,65 @@ class TranslatorApp:
         self.style.configure("TLabel", font=self.custom_font)
         self.style.configure("TLabelframe.Label", font=self.custom_font)
 
-        # Language mappings with better structure for bidirectional translation
-        self.languages = {
-            "English": {"name": "English", "code": "en"},
-            "Chinese": {"name": "中文", "code": "zh"},
-            "Spanish": {"name": "Español", "code": "es"},
-            "French": {"name": "Français", "code": "fr"},
-            "German": {"name": "Deutsch", "code": "de"},
-            "Japanese": {"name": "日本語", "code": "ja"},
-            "Korean": {"name": "한국어", "code": "ko"},
-            "Russian": {"name": "Русский", "code": "ru"},
-        }
-
-        # Initialize device list with GPU priority
-        self.devices = []
-        
-        # Check for CUDA GPUs first and add them to the front of the list
-        if torch.cuda.is_available():
-            gpu_count = torch.cuda.device_count()
-            for i in range(gpu_count):
-                gpu_name = torch.cuda.get_device_name(i)
-                self.devices.append(f"cuda:{i} ({gpu_name})")
-        
-        # Add CPU as the last option
-        self.devices.append("cpu")
+        self.languages = LANGUAGES
+
+        # Only CPU is known until the background device scan has imported torch
+        self.devices = ["cpu"]
 
-        self.model_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
-        self.model = None
-        self.tokenizer = None
+        self.engine = TranslationEngine(cache=TranslationCache())
+        # All translation requests go through one queue so concurrent clicks share batches
+        self.scheduler = BatchScheduler(self.engine)
         self.model_loaded = False
+        # Offloads or frees the weights after DEFAULT_IDLE_TIMEOUT without a translation
+        self.idle_action = tk.StringVar(value=IDLE_ACTIONS["keep"])
+        self.idle_monitor = IdleMonitor(self.engine, action="keep", on_change=self._on_idle_transition)
+        # Cancel token of the translation in progress; a new request cancels the previous one
+        self.current_request = None
         self.device = tk.StringVar(value=self.devices[0])
-        
+        self.cpu_profile = tk.StringVar(value=CPU_PROFILES["bf16"])
+        
+        # Show tokens as they are generated instead of waiting for the full result
+        self.stream_output = tk.BooleanVar(value=True)
+        # Greedy decoding is reproducible, so its results can be served from the translation memory
+        self.deterministic_output = tk.BooleanVar(value=False)
+        self.decoding_mode = tk.StringVar(value=DECODING_MODES["standard"])
+        # Re-translate only the sentences that changed since the last translation
+        self.incremental_mode = tk.BooleanVar(value=True)
+        self.incremental = IncrementalDocument()
+        # Translate automatically once the user stops typing
+        self.live_translate = tk.BooleanVar(value=False)
+        self._live_job = None
+
         # Add source language selection
         self.source_lang = tk.StringVar(value="Chinese")
 
         self.create_widgets()
         self.setup_keyboard_shortcuts()
+        self.scan_devices_thread()
+        self._refresh_memory()
+
+    def scan_devices_thread(self):
+        """Enumerate devices in the background so the window appears before torch is imported"""
+        thread = threading.Thread(target=self._scan_devices)
+        thread.daemon = True
+        thread.start()
+
+    def _scan_devices(self):
+        try:
+            devices = list_devices()
+        except Exception:
+            return  # Keep the CPU-only list; loading will report the real error
+        self.root.after(0, lambda: self._on_devices_scanned(devices))
+
+    def _on_devices_scanned(self, devices):
+        # Several GPUs can hold a model that is too large for any one of them
+        if sum(1 for device in devices if device.startswith("cuda:")) > 1:
+            devices = devices[:-1] + [ALL_GPUS] + devices[-1:]
+        self.devices = devices
+        self.device_menu.config(values=self.devices)
+        # Prefer the first GPU unless the user has already picked something else
+        if not self.model_loaded and self.device.get() == "cpu":
+            self.device.set(self.devices[0])
 
     def create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="10")
@@ -93,8 +128,21 @@ class TranslatorApp:
         self.device_menu = ttk.Combobox(device_frame, textvariable=self.device, values=self.devices, state="readonly")
         self.device_menu.pack(fill=tk.X)
 
+        profile_frame = ttk.LabelFrame(control_frame, text="CPU Profile", padding="10")
+        profile_frame.pack(side=tk.LEFT, fill=tk.X, padx=5)
+        self.profile_menu = ttk.Combobox(profile_frame, textvariable=self.cpu_profile, values=list(CPU_PROFILES.values()), state="readonly")
+        self.profile_menu.pack(fill=tk.X)
+
         self.load_button = ttk.Button(control_frame, text="Load Model", command=self.load_model_thread)
         self.load_button.pack(side=tk.LEFT, fill=tk.X, padx=5)
+        self.unload_button = ttk.Button(control_frame, text="Unload", command=self.unload_model_thread, state=tk.DISABLED)
+        self.unload_button.pack(side=tk.LEFT, fill=tk.X, padx=5)
+
+        idle_frame = ttk.LabelFrame(control_frame, text="When Idle", padding="10")
+        idle_frame.pack(side=tk.LEFT, fill=tk.X, padx=5)
+        self.idle_menu = ttk.Combobox(idle_frame, textvariable=self.idle_action, values=list(IDLE_ACTIONS.values()), state="readonly", width=14)
+        self.idle_menu.pack(fill=tk.X)
+        self.idle_menu.bind("<<ComboboxSelected>>", self._on_idle_action_selected)
 
         # Language selection frame
         lang_frame = ttk.LabelFrame(main_frame, text="Language Settings", padding="10")
@@ -137,6 +185,11 @@ class TranslatorApp:
         input_button_frame.pack(fill=tk.X, pady=(5, 0))
         self.clear_input_button = ttk.Button(input_button_frame, text="Clear Input", command=self.clear_input)
         self.clear_input_button.pack(side=tk.RIGHT)
+        self.incremental_check = ttk.Checkbutton(input_button_frame, text="Only re-translate changed sentences", variable=self.incremental_mode)
+        self.incremental_check.pack(side=tk.LEFT)
+        self.live_check = ttk.Checkbutton(input_button_frame, text="Live translate", variable=self.live_translate)
+        self.live_check.pack(side=tk.LEFT, padx=5)
+        self.input_text.bind("<<Modified>>", self._on_input_modified)
 
         output_frame = ttk.LabelFrame(main_frame, text="Translation Result", padding="10")
         output_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
@@ -159,11 +212,24 @@ class TranslatorApp:
         self.copy_output_button = ttk.Button(output_button_frame, text="Copy Result", command=self.copy_output)
         self.copy_output_button.pack(side=tk.RIGHT)
 
-        self.translate_button = ttk.Button(main_frame, text="Translate", command=self.translate, state=tk.DISABLED)
-        self.translate_button.grid(row=4, column=0, columnspan=2, pady=10)
+        action_frame = ttk.Frame(main_frame)
+        action_frame.grid(row=4, column=0, columnspan=2, pady=10)
+        self.translate_button = ttk.Button(action_frame, text="Translate", command=self.translate, state=tk.DISABLED)
+        self.translate_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(action_frame, text="Cancel", command=self.cancel_translation, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        self.stream_check = ttk.Checkbutton(action_frame, text="Stream output", variable=self.stream_output)
+        self.stream_check.pack(side=tk.LEFT, padx=5)
+        self.deterministic_check = ttk.Checkbutton(action_frame, text="Deterministic (use translation memory)", variable=self.deterministic_output)
+        self.deterministic_check.pack(side=tk.LEFT, padx=5)
+        ttk.Label(action_frame, text="Decoding:").pack(side=tk.LEFT, padx=(10, 2))
+        self.decoding_menu = ttk.Combobox(action_frame, textvariable=self.decoding_mode, values=list(DECODING_MODES.values()), state="readonly", width=14)
+        self.decoding_menu.pack(side=tk.LEFT)
 
         self.status_bar = ttk.Label(main_frame, text="Please select a device and load the model", relief=tk.SUNKEN, anchor=tk.W, font=self.custom_font)
-        self.status_bar.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        self.status_bar.grid(row=5, column=0, sticky=(tk.W, tk.E))
+        self.memory_label = ttk.Label(main_frame, text="", relief=tk.SUNKEN, anchor=tk.E, font=self.custom_font)
+        self.memory_label.grid(row=5, column=1, sticky=(tk.W, tk.E))
 
         self.style.configure("TProgressbar", background="#4CAF50", troughcolor="#E0E0E0", bordercolor="#4CAF50", lightcolor="#4CAF50", darkcolor="#4CAF50")
         self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", length=200, mode="indeterminate", style="TProgressbar")
@@ -177,48 +243,37 @@ class TranslatorApp:
         self.target_lang.set(source)
 
     def load_model_thread(self):
+        """Load the model, or move it to the selected device if one is already loaded"""
+        if self.current_request is not None:
+            self.current_request.cancel()
+        self.model_loaded = False
         self.load_button.config(state=tk.DISABLED)
+        self.unload_button.config(state=tk.DISABLED)
+        self.translate_button.config(state=tk.DISABLED)
         self.device_menu.config(state=tk.DISABLED)
+        self.profile_menu.config(state=tk.DISABLED)
         self.status_bar.config(text=f"Loading translation engine to {self.device.get().upper()}... please wait")
         thread = threading.Thread(target=self._load_model)
         thread.daemon = True
         thread.start()
 
     def _load_model(self):
-        device_selection = self.device.get()
-        
-        # Parse device from selection (extract cuda:X from "cuda:X (GPU Name)" format)
-        if device_selection.startswith("cuda:"):
-            device = device_selection.split(" ")[0]  # Extract "cuda:X" part
-        else:
-            device = "cpu"
-        
         self.root.after(0, lambda: self.progress_bar.start())
         self.root.after(0, lambda: self.progress_bar.config(mode="indeterminate"))
-        
-        status_prefix = ""
-        if device == "cpu":
-            status_prefix = "(CPU loading can be slow, please be patient) "
 
         try:
-            self.root.after(0, lambda: self.status_bar.config(text=f'{status_prefix}Loading tokenizer... (1/4)'))
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, legacy=False)
-            self.root.after(0, lambda: self.status_bar.config(text=f'{status_prefix}Loading model configuration... (2/4)'))
-            config = AutoConfig.from_pretrained(self.model_name)
-            
-            model_path = self.model_name
-
-            self.root.after(0, lambda: self.status_bar.config(text=f'{status_prefix}Initializing empty model... (3/4)'))
-            with init_empty_weights():
-                model_empty = AutoModelForCausalLM.from_config(config)
-            
-            model_empty.tie_weights()
-
-            self.root.after(0, lambda: self.status_bar.config(text=f'{status_prefix}Loading model weights to {device.upper()}... (4/4)'))
-            self.model = load_checkpoint_and_dispatch(
-                model_empty, model_path, device_map={"": device}, no_split_module_classes=["LlamaDecoderLayer"], dtype=torch.bfloat16
-            )
-
+            profile = next(key for key, label in CPU_PROFILES.items() if label == self.cpu_profile.get())
+            selection = self.device.get()
+            if self.engine.residency != "unloaded":
+                # Switching devices: free the old copy first so both never coexist
+                self._set_status("Unloading current model...")
+                self.engine.unload()
+            if selection == ALL_GPUS:
+                gpus = [parse_device(device) for device in self.devices if device.startswith("cuda:")]
+                self.engine.load(gpus[0], progress=self._set_status, cpu_profile=profile, shard_devices=gpus)
+            else:
+                self.engine.load(selection, progress=self._set_status, cpu_profile=profile)
+            self.scheduler.start()
             self.model_loaded = True
             self.root.after(0, self._on_model_loaded)
         except Exception as e:
@@ -226,23 +281,92 @@ class TranslatorApp:
         finally:
             self.root.after(0, lambda: self.progress_bar.stop())
 
+    def _set_status(self, message, token=None):
+        """Thread-safe status bar update; dropped if `token` is no longer the current request"""
+        def update():
+            if token is None or token is self.current_request:
+                self.status_bar.config(text=message)
+        self.root.after(0, update)
+
     def _on_model_loaded(self):
-        final_device = next(self.model.parameters()).device
+        final_device = next(self.engine.model.parameters()).device
         device_status_message = f"Model loaded successfully, using {str(final_device).upper()}."
         if "cuda" in self.device.get() and "cuda" not in str(final_device):
             device_status_message = f"Model loaded successfully, using {str(final_device).upper()}. (Warning: Model not fully loaded to the selected GPU.)"
-        self.root.after(0, lambda: self.status_bar.config(text=device_status_message))
-        self.root.after(0, lambda: self.translate_button.config(state=tk.NORMAL))
+        load_time = sum(self.engine.load_timings.values())
+        phases = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.engine.load_timings.items())
+        device_status_message += f" Loaded in {load_time:.1f}s ({phases})."
+        device_status_message += f" Profile: {self.engine.cpu_profile}, weights: {format_bytes(self.engine.memory_footprint)}, process RSS: {format_bytes(self.engine.process_rss)}."
+        if len(self.engine.memory_by_device) > 1:
+            device_status_message += " Split: " + ", ".join(
+                f"{device} {format_bytes(size)}" for device, size in sorted(self.engine.memory_by_device.items())
+            ) + "."
+        self.status_bar.config(text=device_status_message)
+        self.translate_button.config(state=tk.NORMAL)
+        self.unload_button.config(state=tk.NORMAL)
+        self.load_button.config(text="Switch Device", state=tk.NORMAL)
+        self.device_menu.config(state="readonly")
+        self.profile_menu.config(state="readonly")
+        self.idle_monitor.start()
 
     def _on_model_load_error(self, e):
         self.status_bar.config(text="Model loading failed, please check the error message.")
-        self.load_button.config(state=tk.NORMAL)
-        self.device_menu.config(state=tk.NORMAL)
+        self.load_button.config(text="Load Model", state=tk.NORMAL)
+        self.device_menu.config(state="readonly")
+        self.profile_menu.config(state="readonly")
         self.root.after(0, lambda e=e: messagebox.showerror("Model Load Error", f"Error loading model: {e}"))
 
-    def translate(self):
+    def unload_model_thread(self):
+        """Free the model's memory; Load Model brings it back"""
+        if self.current_request is not None:
+            self.current_request.cancel()
+        self.model_loaded = False
+        self.translate_button.config(state=tk.DISABLED)
+        self.unload_button.config(state=tk.DISABLED)
+        self.load_button.config(state=tk.DISABLED)
+        self.status_bar.config(text="Unloading model...")
+        thread = threading.Thread(target=self._unload_model)
+        thread.daemon = True
+        thread.start()
+
+    def _unload_model(self):
+        self.engine.cancel()
+        self.engine.unload()
+        self.root.after(0, self._on_model_unloaded)
+
+    def _on_model_unloaded(self):
+        self.status_bar.config(text="Model unloaded. Select a device and load it again to translate.")
+        self.load_button.config(text="Load Model", state=tk.NORMAL)
+        self._refresh_memory(reschedule=False)
+
+    def _on_idle_action_selected(self, event=None):
+        self.idle_monitor.action = next(key for key, label in IDLE_ACTIONS.items() if label == self.idle_action.get())
+
+    def _on_idle_transition(self, residency):
+        """Called from the idle monitor thread after the weights were offloaded or freed"""
+        minutes = DEFAULT_IDLE_TIMEOUT // 60
+        if residency == "offloaded":
+            message = f"Idle for {minutes} minutes: model moved to CPU memory, it returns on the next translation."
+        else:
+            message = f"Idle for {minutes} minutes: model memory freed, it reloads on the next translation."
+        self._set_status(message)
+
+    def _refresh_memory(self, reschedule=True):
+        """Show current and peak memory of the process and of the model's GPUs"""
+        report = memory_report(self.engine.memory_by_device)
+        parts = [f"RAM {format_bytes(report['rss_bytes'])} (peak {format_bytes(report['peak_rss_bytes'])})"]
+        for device, stats in report["devices"].items():
+            parts.append(f"{device} {format_bytes(stats['allocated_bytes'])} (peak {format_bytes(stats['peak_bytes'])})")
+        if self.engine.residency in ("offloaded", "released"):
+            parts.append(f"model {self.engine.residency}")
+        self.memory_label.config(text=" · ".join(parts))
+        if reschedule:
+            self.root.after(MEMORY_REFRESH_MS, self._refresh_memory)
+
+    def translate(self, live=False):
         if not self.model_loaded:
-            messagebox.showinfo("Please Wait", "The model is still loading, please try again later.")
+            if not live:
+                messagebox.showinfo("Please Wait", "The model is still loading, please try again later.")
             return
 
         input_content = self.input_text.get("1.0", tk.END).strip()
@@ -251,178 +375,254 @@ class TranslatorApp:
 
         # Validate language selection
         if self.source_lang.get() == self.target_lang.get():
-            messagebox.showwarning("Language Selection", "Source and target languages cannot be the same.")
-            return
-
-        max_chars = 5000  # Set limit to 5000 characters
-        if len(input_content) > max_chars:
-            # Show warning and ask user to shorten the text
-            messagebox.showwarning(
-                "Text Too Long", 
-                f"Input text is {len(input_content)} characters long, which exceeds the {max_chars} character limit.\n\n"
-                f"Please shorten your text by {len(input_content) - max_chars} characters and try again.\n\n"
-                f"Tip: You can split long texts into smaller parts for better translation quality."
-            )
+            if not live:
+                messagebox.showwarning("Language Selection", "Source and target languages cannot be the same.")
             return
 
         if not input_content:
             return
 
-        self.output_text.config(state=tk.NORMAL)
-        self.output_text.delete("1.0", tk.END)
-        self.output_text.insert(tk.END, "Translating...")
-        self.output_text.config(state=tk.DISABLED)
-        self.translate_button.config(state=tk.DISABLED)
+        # A new request supersedes the one in progress, which stops at its next token
+        if self.current_request is not None:
+            self.current_request.cancel()
+        token = CancelToken()
+        self.current_request = token
+
+        # Incremental updates rewrite the previous result in place instead of blanking it
+        if not (self.incremental_mode.get() and self.incremental.segments):
+            self.output_text.config(state=tk.NORMAL)
+            self.output_text.delete("1.0", tk.END)
+            self.output_text.insert(tk.END, "Translating...")
+            self.output_text.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
         self.root.update_idletasks()
 
-        thread = threading.Thread(target=self._perform_translation, args=(input_content, source_lang, target_lang))
+        self.engine.deterministic = self.deterministic_output.get()
+        self.engine.decoding_mode = next(key for key, label in DECODING_MODES.items() if label == self.decoding_mode.get())
+
+        thread = threading.Thread(target=self._perform_translation, args=(input_content, source_lang, target_lang, token))
         thread.daemon = True
         thread.start()
 
-    def _perform_translation(self, input_content, source_lang, target_lang):
+    def _on_input_modified(self, event=None):
+        """Debounce typing into one live translation after LIVE_TRANSLATE_DELAY_MS of quiet"""
+        if not self.input_text.edit_modified():
+            return
+        self.input_text.edit_modified(False)
+        if not self.live_translate.get():
+            return
+        if self._live_job is not None:
+            self.root.after_cancel(self._live_job)
+        self._live_job = self.root.after(LIVE_TRANSLATE_DELAY_MS, self._live_translate)
+
+    def _live_translate(self):
+        self._live_job = None
+        self.translate(live=True)
+
+    def cancel_translation(self):
+        """Stop the translation in progress"""
+        if self.current_request is None or self.current_request.cancelled:
+            return
+        self.current_request.cancel()
+        self.status_bar.config(text="Cancelling...")
+
+    def _perform_translation(self, input_content, source_lang, target_lang, token):
         self.root.after(0, lambda: self.progress_bar.start())
         self.root.after(0, lambda: self.progress_bar.config(mode="indeterminate"))
         start_time = time.time()
         try:
-            self.root.after(0, lambda: self.status_bar.config(text="Preparing input... (1/3)"))
-            
-            # Create a more robust prompt for better translation quality
-            source_name = source_lang["name"]
-            target_name = target_lang["name"]
-            
-            # Use extremely simple prompts to get only translation without explanations
-            if source_name == "中文" and target_name == "English":
-                prompt = f"中文：{input_content}\n英文："
-            elif source_name == "English" and target_name == "中文":
-                prompt = f"English: {input_content}\n中文："
-            elif source_name == "中文":
-                prompt = f"中文：{input_content}\n{target_name}："
-            elif target_name == "English":
-                prompt = f"{source_name}: {input_content}\nEnglish:"
-            else:
-                prompt = f"{source_name}: {input_content}\n{target_name}:"
-
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-            input_length = inputs.input_ids.shape[1]
-
-            self.root.after(0, lambda: self.status_bar.config(text="Generating translation... (2/3)"))
-            
-            # Optimized generation parameters for complete translations
-            outputs = self.model.generate(
-                inputs.input_ids,
-                max_new_tokens=1536,  # Further increased for very long texts
-                num_return_sequences=1,
-                do_sample=True,  # Enable sampling for better quality
-                temperature=0.2,  # Slightly higher temperature for better flow
-                top_p=0.9,
-                repetition_penalty=1.02,  # Reduced to avoid cutting off valid repetitions
-                pad_token_id=self.tokenizer.eos_token_id,
-                # Remove explicit eos_token_id to prevent premature stopping
-                early_stopping=False,
-                length_penalty=1.0  # Encourage longer outputs
-            )
-            
-            self.root.after(0, lambda: self.status_bar.config(text="Decoding output... (3/3)"))
-            
-            # Decode only the new tokens (translation part)
-            generated_tokens = outputs[0][input_length:]
-            translated_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True).strip()
-            
-            # Clean up the translation output
-            translated_text = self._clean_translation_output(translated_text, input_content, source_name, target_name)
+            if self.engine.residency != "resident":
+                self._set_status("Restoring model after idle...", token)
+            # Incremental mode keeps one segment per sentence so an edit only invalidates its sentence
+            segments, layout = segment_document(input_content, source_lang["code"], merge=not self.incremental_mode.get())
+            if self.incremental_mode.get():
+                reused = self.incremental.reuse(segments, source_lang["code"], target_lang["code"])
+                if any(translation is not None for translation in reused):
+                    self._perform_incremental_translation(segments, layout, reused, source_lang, target_lang, start_time, token)
+                    return
+                # Nothing carries over, so the previous result left on screen is stale
+                self._set_output("Translating...", token)
+
+            if len(segments) > 1:
+                if self.stream_output.get():
+                    self._perform_streaming_document_translation(segments, layout, source_lang, target_lang, start_time, token)
+                else:
+                    self._perform_document_translation(segments, layout, source_lang, target_lang, start_time, token)
+                return
+
+            if self.stream_output.get():
+                translated_text = self._perform_streaming_translation(input_content, source_lang, target_lang, token)
+                self.incremental.update(segments, [translated_text], source_lang["code"], target_lang["code"])
+                return
+
+            self._set_status("Generating translation...", token)
+            translated_text = self.scheduler.translate(input_content, source_lang, target_lang, cancel_token=token)
 
             translated_chars = len(translated_text)
             end_time = time.time()
             time_taken = end_time - start_time
 
-            self.root.after(0, lambda: self.output_text.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.output_text.delete("1.0", tk.END))
-            self.root.after(0, lambda: self.output_text.insert(tk.END, translated_text))
-            self.root.after(0, lambda: self.output_text.config(state=tk.DISABLED))
-            self.root.after(0, lambda: self.status_bar.config(text=f"Translation complete! Translated {translated_chars} characters in {time_taken:.2f} seconds."))
+            self.incremental.update(segments, [translated_text], source_lang["code"], target_lang["code"])
+            self._set_output(translated_text, token)
+            self._set_status(f"Translation complete! Translated {translated_chars} characters in {time_taken:.2f} seconds." + self._decoding_summary(), token)
+        except (TranslationCancelled, CancelledError):
+            # Requests still queued when cancelled surface as CancelledError
+            self._set_output("Translation cancelled.", token)
+            self._set_status("Translation cancelled.", token)
         except Exception as e:
-            self.root.after(0, lambda: self.output_text.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.output_text.delete("1.0", tk.END))
-            self.root.after(0, lambda: self.output_text.insert(tk.END, f"Translation error: {e}"))
-            self.root.after(0, lambda: self.output_text.config(state=tk.DISABLED))
-            self.root.after(0, lambda: self.status_bar.config(text="Translation failed, please check the error message."))
-            self.root.after(0, lambda e=e: messagebox.showerror("Translation Error", f"Error during translation: {e}"))
+            if token is self.current_request:
+                self._set_output(f"Translation error: {e}", token)
+                self._set_status("Translation failed, please check the error message.", token)
+                self.root.after(0, lambda e=e: messagebox.showerror("Translation Error", f"Error during translation: {e}"))
         finally:
-            self.root.after(0, lambda: self.translate_button.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.progress_bar.stop())
+            self.root.after(0, lambda: self._on_translation_finished(token))
 
-    def _clean_translation_output(self, translated_text, input_content, source_name, target_name):
-        """Clean up the translation output to remove unwanted artifacts"""
-        import re
-        
-        # Store original for debugging
-        original_text = translated_text
-        
-        # First, look for strong explanation markers that definitely indicate non-translation content
-        strong_explanation_markers = [
-            '[COT]', '[cot]', 'This is an advertisement', 'The purpose here should be',
-            'Firstly，the brand name', 'Secondly，the model number', 'Thirdly，the term',
-            'Fourthly，the phrase', 'Finally, the overall tone'
-        ]
-        
-        # Only cut off at strong markers to avoid cutting valid translation
-        for marker in strong_explanation_markers:
-            if marker in translated_text:
-                pos = translated_text.find(marker)
-                translated_text = translated_text[:pos].strip()
-                break
-        
-        # Remove only the most obvious prompt artifacts at the beginning
-        start_cleanup_patterns = [
-            f"{source_name}:", f"{target_name}:",
-            "翻译成英文：", "英文：", "中文：", "English:"
-        ]
-        
-        for pattern in start_cleanup_patterns:
-            if translated_text.startswith(pattern):
-                translated_text = translated_text[len(pattern):].strip()
-        
-        # Remove leading/trailing quotes only if they wrap the entire text
-        if translated_text.startswith('"') and translated_text.endswith('"'):
-            translated_text = translated_text[1:-1].strip()
-        if translated_text.startswith("'") and translated_text.endswith("'"):
-            translated_text = translated_text[1:-1].strip()
-        
-        # Fix spacing issues but be conservative
-        translated_text = re.sub(r'\s+', ' ', translated_text)  # Multiple spaces to single
-        
-        # Only fix obvious concatenation errors
-        spacing_fixes = [
-            ("supportfor", "support for"),
-            ("creatorsand", "creators and"),
-            ("placingan", "placing an"),
-            ("researchng", "researching"),
-            ("furtherabout", "further about"),
-            ("thismodelandloveditmoreandenmore", "this model and loved it more and more"),
-            ("askingthe", "asking the"),
-            ("salesmaniftherewasanyexhibitioncarbut", "salesman if there was any exhibition car but"),
-            ("waitednearly", "waited nearly"),
-            ("monthsforone", "months for one"),
-            ("arrive", "to arrive")
-        ]
-        
-        for wrong, correct in spacing_fixes:
-            translated_text = translated_text.replace(wrong, correct)
-        
-        # Clean up any remaining formatting issues
-        translated_text = re.sub(r'\s+', ' ', translated_text).strip()
-        
-        # If the result is too short, return the original with minimal cleanup
-        if len(translated_text.strip()) < 20:
-            # Just remove the most obvious artifacts from original
-            minimal_cleanup = original_text
-            for pattern in start_cleanup_patterns:
-                if minimal_cleanup.startswith(pattern):
-                    minimal_cleanup = minimal_cleanup[len(pattern):].strip()
-            return minimal_cleanup if minimal_cleanup else "Translation failed - please try again with different text."
-        
+    def _on_translation_finished(self, token):
+        # A superseded request finishing must not reset the controls of its successor
+        if token is not self.current_request:
+            return
+        self.current_request = None
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_bar.stop()
+
+    def _perform_document_translation(self, segments, layout, source_lang, target_lang, start_time, token):
+        # Queue every segment at once so the scheduler can fill its batches; they share
+        # the request's cancel token, so cancelling drops the ones still queued
+        futures = [self.scheduler.submit(segment, source_lang, target_lang, cancel_token=token) for segment in segments]
+        translations = []
+        for future in futures:
+            translations.append(future.result())
+            self._set_status(f"Translating... {len(translations)}/{len(segments)} segments done", token)
+
+        self.incremental.update(segments, translations, source_lang["code"], target_lang["code"])
+        translated_text = reassemble(translations, layout, target_lang["code"])
+        time_taken = time.time() - start_time
+        self._set_output(translated_text, token)
+        self._set_status(
+            f"Translation complete! Translated {len(translated_text)} characters "
+            f"({len(segments)} segments) in {time_taken:.2f} seconds.", token
+        )
+
+    def _perform_streaming_document_translation(self, segments, layout, source_lang, target_lang, start_time, token):
+        """Stream the segments one after another, appending each to the output as it is generated"""
+        leads = segment_leads(layout, target_lang["code"])
+        translations = []
+        self._set_output("", token)
+        self._set_status("Waiting for first token...", token)
+        for i, segment in enumerate(segments):
+            self._append_output(leads[i], token)
+            translation = self.engine.cached_translation(segment, source_lang, target_lang)
+            if translation is None:
+                stream = self.engine.translate_stream(segment, source_lang, target_lang, cancel_token=token)
+                for chunk in stream:
+                    self._append_output(chunk, token)
+                    self._set_status(self._stream_status(stream, f"Translating segment {i + 1}/{len(segments)}"), token)
+                translation = stream.result()
+            else:
+                self._append_output(translation.strip(), token)
+            translations.append(translation)
+
+        self.incremental.update(segments, translations, source_lang["code"], target_lang["code"])
+        # Swap the raw streams for the cleaned translations
+        translated_text = reassemble(translations, layout, target_lang["code"])
+        time_taken = time.time() - start_time
+        self._set_output(translated_text, token)
+        self._set_status(
+            f"Translation complete! Translated {len(translated_text)} characters "
+            f"({len(segments)} segments) in {time_taken:.2f} seconds.", token
+        )
+
+    def _perform_incremental_translation(self, segments, layout, reused, source_lang, target_lang, start_time, token):
+        """Translate only the segments without a reusable translation, updating the output in place"""
+        translations = list(reused)
+        todo = [i for i, translation in enumerate(translations) if translation is None]
+        futures = [(i, self.scheduler.submit(segments[i], source_lang, target_lang, cancel_token=token)) for i in todo]
+
+        def render():
+            shown = [PENDING_SEGMENT if translation is None else translation for translation in translations]
+            self._set_output(reassemble(shown, layout, target_lang["code"]), token, keep_view=True)
+
+        render()
+        for done, (i, future) in enumerate(futures, 1):
+            translations[i] = future.result()
+            render()
+            self._set_status(f"Updating... {done}/{len(todo)} changed segments done", token)
+
+        self.incremental.update(segments, translations, source_lang["code"], target_lang["code"])
+        time_taken = time.time() - start_time
+        self._set_status(
+            f"Translation updated! Re-translated {len(todo)} of {len(segments)} segments "
+            f"in {time_taken:.2f} seconds.", token
+        )
+
+    def _perform_streaming_translation(self, input_content, source_lang, target_lang, token):
+        cached = self.engine.cached_translation(input_content, source_lang, target_lang)
+        if cached is not None:
+            stats = self.engine.cache.stats()
+            self._set_output(cached, token)
+            self._set_status(f"Loaded from translation memory (hit rate {stats['hit_rate']:.0%}).", token)
+            return cached
+
+        self._set_status("Waiting for first token...", token)
+        stream = self.engine.translate_stream(input_content, source_lang, target_lang, cancel_token=token)
+
+        first_chunk = True
+        for chunk in stream:
+            if first_chunk:
+                # Replace the "Translating..." placeholder with the first piece of text
+                self._set_output(chunk, token)
+                first_chunk = False
+            else:
+                self._append_output(chunk, token)
+            self._set_status(self._stream_status(stream, "Translating"), token)
+
+        # Swap the raw stream for the cleaned translation
+        translated_text = stream.result()
+        self._set_output(translated_text, token)
+        self._set_status(self._stream_status(stream, f"Translation complete! Translated {len(translated_text)} characters") + self._decoding_summary(), token)
         return translated_text
 
+    def _decoding_summary(self):
+        """Accepted draft tokens and forward-pass speedup of the last accelerated generation"""
+        stats = self.engine.last_decoding_stats
+        if not stats or stats["mode"] == "standard":
+            return ""
+        return (f" {DECODING_MODES[stats['mode']]}: {stats['accepted_draft_tokens']} drafted tokens accepted, "
+                f"{stats['tokens_per_forward']:.2f}x tokens per forward pass.")
+
+    def _stream_status(self, stream, prefix):
+        parts = [prefix]
+        if stream.time_to_first_token is not None:
+            parts.append(f"first token in {stream.time_to_first_token:.2f}s")
+        if stream.tokens_per_second is not None:
+            parts.append(f"{stream.tokens_per_second:.1f} tokens/sec")
+        return " | ".join(parts)
+
+    def _set_output(self, text, token=None, keep_view=False):
+        """Thread-safe replacement of the output pane content; `keep_view` preserves the scroll position"""
+        def update():
+            if token is not None and token is not self.current_request:
+                return
+            view = self.output_text.yview()[0]
+            self.output_text.config(state=tk.NORMAL)
+            self.output_text.delete("1.0", tk.END)
+            self.output_text.insert(tk.END, text)
+            self.output_text.config(state=tk.DISABLED)
+            if keep_view:
+                self.output_text.yview_moveto(view)
+        self.root.after(0, update)
+
+    def _append_output(self, text, token=None):
+        """Thread-safe append to the output pane"""
+        def update():
+            if token is not None and token is not self.current_request:
+                return
+            self.output_text.config(state=tk.NORMAL)
+            self.output_text.insert(tk.END, text)
+            self.output_text.see(tk.END)
+            self.output_text.config(state=tk.DISABLED)
+        self.root.after(0, update)
+
     def clear_input(self):
         """Clear the input text area"""
         self.input_text.delete("1.0", tk.END)
@@ -445,9 +645,12 @@ class TranslatorApp:
         """Setup keyboard shortcuts for better user experience"""
         # Ctrl+Enter to translate
         self.root.bind('<Control-Return>', lambda e: self.translate() if self.model_loaded else None)
+
+        # Esc to cancel the translation in progress
+        self.root.bind('<Escape>', lambda e: self.cancel_translation())
         
         # Ctrl+L to load model
-        self.root.bind('<Control-l>', lambda e: self.load_model_thread() if not self.model_loaded else None)
+        self.root.bind('<Control-l>', lambda e: self.load_model_thread() if self.engine.residency == "unloaded" else None)
         
         # Ctrl+Shift+C to copy output
         self.root.bind('<Control-Shift-C>', lambda e: self.copy_output())
@@ -465,7 +668,8 @@ class TranslatorApp:
         """Show keyboard shortcuts help"""
         help_text = """Keyboard Shortcuts:
 
-Ctrl+Enter - Translate text
+Ctrl+Enter - Translate text (replaces a translation in progress)
+Esc - Cancel the translation in progress
 Ctrl+L - Load model
 Ctrl+Shift+C - Copy translation result
 Ctrl+Shift+X - Clear input text
@@ -476,6 +680,10 @@ Tips:
 • Make sure to load the model before translating
 • Use the swap button (⇄) to quickly switch languages
 • The app supports bidirectional translation between multiple languages
+• "When Idle" offloads the model to CPU memory or frees it after 15 idle minutes; the next translation restores it
+• Use "Switch Device" to move a loaded model to another device, or "Unload" to free its memory
+• Long texts are split into sentences and translated in batches
+• With "Only re-translate changed sentences", editing a translated text regenerates just the edited sentences
 • Translation quality depends on the loaded model"""
         
         messagebox.showinfo("Help - Keyboard Shortcuts", help_text)